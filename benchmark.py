@@ -0,0 +1,620 @@
+"""ci_stock_monitor の性能計測スクリプト
+
+使い方:
+    python benchmark.py session [--limit N]
+    python benchmark.py classify [--iterations N]
+    python benchmark.py profile [--limit N]
+    python benchmark.py offline [--backends http selenium] [--concurrency 1 4 8] [--products N]
+    python benchmark.py startup [--runs N]
+    python benchmark.py records [--count N]
+
+session:  商品ごとにChromeを起動してログインする従来の方式と、
+          BrowserSessionで1つのログイン済みChromeを使い回す方式の
+          1商品あたりの所要時間を比較する（CI Medicalのログイン情報が必要）
+classify: fixtures/pages の保存済みページについて、従来の soup.find による判定と
+          StockClassifier による判定の、1ページあたりの解析+判定時間を比較する
+          （ページの一部を書き換えたときに、HTTP取得のキャッシュに使うページのハッシュが
+          判定に使う部分の変化だけで変わることも確認する）
+profile:  Chromeの standard / lean プロファイルで、1商品あたりのページ読み込み時間と
+          転送バイト数を比較する（CI Medicalのログイン情報が必要）
+offline:  fixtures/pages の保存済みページを返すローカルのスタブサーバーに対して、
+          実際の取得処理（ログイン、取得、解析、判定）を通して商品をチェックし、
+          取得方式と並行数ごとのスループット、p50/p95レイテンシ、最大RSSを計測する
+          （ログイン情報は不要。判定結果が期待値と一致しない場合は終了コード1）
+startup:  python -X importtime で、起動・HTTP取得・Selenium取得の各経路が読み込むモジュールと
+          読み込み時間を計測する（取得を行わない経路で requests / bs4 / selenium を
+          読み込んでいる場合は終了コード1）
+records:  保存済みページから取り出した ProductRecord を N 件保持したときのメモリ使用量を、状態ファイルの
+          辞書のまま保持した場合と比較し、前回の記録との比較（変化なし / 一部値下げ）の所要時間を計測する
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import replace
+
+from bs4 import BeautifulSoup
+
+import stub_server
+from ci_stock_monitor import classifier, config, fetchers
+from ci_stock_monitor.metrics import percentile
+from ci_stock_monitor.records import ProductRecord
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pages")
+
+# ページのハッシュの確認に使う保存済みページと、(確認する内容, 置き換え前, 置き換え後, ハッシュが変わるべきか)
+FINGERPRINT_PAGE = "nested_variants.html"
+FINGERPRINT_CASES = [
+    ("入れ子になった納期", "出荷目安: 3日", "出荷目安: 2週間", True),
+    ("入れ子になった在庫数", "在庫数: 12", "在庫数: 3", True),
+    ("規格の価格", '<div class="variation-price">1,200円', '<div class="variation-price">900円', True),
+    (
+        "規格の在庫",
+        '1,200円</div></td><td><div class="variation-stock">在庫なし',
+        '1,200円</div></td><td><div class="variation-stock">在庫あり',
+        True,
+    ),
+    ("おすすめ商品", "おすすめ商品5", "おすすめ商品99", False),
+]
+
+def load_fixture_pages():
+    """保存済みページと期待される判定結果を読み込む
+
+    Returns:
+        list: (ファイル名, HTML, 期待値) のリスト
+    """
+    with open(os.path.join(FIXTURE_DIR, "expected.json"), encoding="utf-8") as f:
+        expected = json.load(f)
+
+    pages = []
+    for filename in sorted(expected):
+        with open(os.path.join(FIXTURE_DIR, filename), encoding="utf-8") as f:
+            pages.append((filename, f.read(), expected[filename]))
+    return pages
+
+def bench_session(args):
+    """商品ごとのログインとセッション使い回しの所要時間を比較する"""
+    from ci_stock_monitor.fetchers.browser import BrowserSession, get_stock_status_with_selenium
+
+    urls = config.PRODUCT_URLS[:args.limit] if args.limit else config.PRODUCT_URLS
+
+    start = time.perf_counter()
+    for product_url in urls:
+        get_stock_status_with_selenium(product_url)
+    per_url_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with BrowserSession() as session:
+        for product_url in urls:
+            get_stock_status_with_selenium(product_url, session)
+        login_count = session.login_count
+    shared_elapsed = time.perf_counter() - start
+
+    print("\n=== ベンチマーク結果 ===")
+    print(f"商品数: {len(urls)}")
+    print(f"商品ごとにログイン: 合計 {per_url_elapsed:.1f}秒 / 1商品あたり {per_url_elapsed / len(urls):.2f}秒")
+    print(f"セッション使い回し: 合計 {shared_elapsed:.1f}秒 / 1商品あたり {shared_elapsed / len(urls):.2f}秒 (ログイン回数: {login_count})")
+    if shared_elapsed > 0:
+        print(f"高速化: {per_url_elapsed / shared_elapsed:.1f}倍")
+
+def bench_profile(args):
+    """standard / lean プロファイルのページ読み込み時間と転送量を比較する（ログインは計測から除く）"""
+    from ci_stock_monitor.fetchers.browser import BrowserSession
+
+    urls = config.PRODUCT_URLS[:args.limit] if args.limit else config.PRODUCT_URLS
+    results = {}
+
+    for profile in ("standard", "lean"):
+        load_times = []
+        transfer_bytes = []
+        with BrowserSession(profile) as session:
+            session.ensure_logged_in()
+            for product_url in urls:
+                session.fetch_page_source(product_url)
+                load_times.append(session.last_timings["navigate"] + session.last_timings["ready"])
+                transfer_bytes.append(session.last_transfer_bytes)
+        results[profile] = (sum(load_times) / len(urls), sum(transfer_bytes) / len(urls))
+
+    print("\n=== ベンチマーク結果 ===")
+    print(f"商品数: {len(urls)}")
+    for profile, (load_time, transfer) in results.items():
+        print(f"{profile:<10} 1商品あたり 読み込み {load_time:.2f}秒 / 転送量 {transfer / 1024:.0f}KB")
+
+def legacy_product_name(soup, product_url):
+    """従来の方式（セレクタごとの soup.find）で、BeautifulSoupオブジェクトから商品名を抽出する
+
+    Args:
+        soup: BeautifulSoupオブジェクト
+        product_url: 商品URL（フォールバック用）
+
+    Returns:
+        str: 商品名（取得できない場合は商品ID）
+    """
+    # 優先順に様々なセレクタを試行
+    for tag, attrs in classifier.NAME_SELECTORS:
+        element = soup.find(tag, attrs) if attrs else soup.find(tag)
+        if element:
+            product_name = element.text.strip()
+            # 空白や改行を正規化
+            product_name = " ".join(product_name.split())
+            # 商品名として有効か確認（長さが3文字以上、URLでない）
+            if product_name and len(product_name) >= 3 and "http" not in product_name.lower():
+                print(f"商品名を取得: {tag} {attrs} -> {product_name}")
+                return product_name
+
+    # OGPメタタグから取得を試行
+    og_title = soup.find("meta", {"property": "og:title"})
+    if og_title and og_title.get("content"):
+        product_name = og_title["content"].strip()
+        if product_name:
+            print(f"商品名をOGPタグから取得: {product_name}")
+            return product_name
+
+    # ページタイトルから取得を試行
+    title_tag = soup.find("title")
+    if title_tag:
+        title_text = title_tag.text.strip()
+        # タイトルから不要な部分を除去（例: "商品名 | サイト名"）
+        if " | " in title_text:
+            product_name = title_text.split(" | ")[0].strip()
+        elif " - " in title_text:
+            product_name = title_text.split(" - ")[0].strip()
+        else:
+            product_name = title_text
+
+        if product_name and len(product_name) >= 3:
+            print(f"商品名をページタイトルから取得: {product_name}")
+            return product_name
+
+    # 最後の手段: 商品IDを返す
+    print("警告: 商品名を取得できませんでした。利用可能なh1タグを探します...")
+    all_h1 = soup.find_all("h1")
+    if all_h1:
+        print(f"見つかったh1タグの数: {len(all_h1)}")
+        for idx, h1 in enumerate(all_h1[:3]):  # 最初の3つまで表示
+            print(f"  h1[{idx}]: クラス={h1.get('class')}, テキスト={h1.text.strip()[:50]}")
+
+    product_id = product_url.split("/")[-1]
+    return f"商品ID: {product_id}"
+
+def legacy_stock_status(soup):
+    """従来の方式（条件ごとの soup.find）で、BeautifulSoupオブジェクトから在庫状況を判定する
+
+    Args:
+        soup: BeautifulSoupオブジェクト
+
+    Returns:
+        str: "在庫あり" または "在庫なし"
+    """
+    # **まず在庫なしを示すメッセージを優先的に確認**
+    stock_status_element = soup.find("span", class_="product-stock__status")
+    if stock_status_element:
+        stock_text = stock_status_element.text.strip()
+        stock_classes = stock_status_element.get("class", [])
+
+        if "在庫なし" in stock_text or "is-soldout" in stock_classes:
+            print(f"在庫なしと判断しました。（在庫状況表示: {stock_text}, クラス: {stock_classes}）")
+            return "在庫なし"
+        elif "在庫あり" in stock_text:
+            print(f"在庫ありと判断しました。（在庫状況表示: {stock_text}）")
+            return "在庫あり"
+
+    # **「在庫なし」ボタンを確認**
+    cart_button = soup.find("a", class_="button-cart")
+    if cart_button:
+        button_text = cart_button.text.strip()
+        button_classes = cart_button.get("class", [])
+
+        if "在庫なし" in button_text or "button-cart--disabled" in button_classes:
+            print(f"在庫なしと判断しました。（ボタン表示: {button_text}, クラス: {button_classes}）")
+            return "在庫なし"
+        elif "買い物カゴ" in button_text or "カート" in button_text:
+            print(f"在庫ありと判断しました。（ボタン表示: {button_text}）")
+            return "在庫あり"
+
+    # **購入フォームの状態を確認**
+    product_form = soup.find("div", class_="product-form")
+    if product_form:
+        form_classes = product_form.get("class", [])
+        if "is-disabled" in form_classes:
+            print(f"在庫なしと判断しました。（購入フォームが無効化されているため: {form_classes}）")
+            return "在庫なし"
+
+    # **「買い物カゴに入れる」ボタンの有無を確認（より広範囲）**
+    for selector in classifier.CART_BUTTON_SELECTORS:
+        add_to_cart_button = soup.find("a", selector) or soup.find("button", selector)
+        if add_to_cart_button:
+            button_text = add_to_cart_button.text.strip()
+            if "買い物カゴ" in button_text or "カート" in button_text:
+                print(f"在庫ありと判断しました。（「買い物カゴに入れる」ボタンが見つかったため: {selector}）")
+                return "在庫あり"
+
+    # **在庫なしを示すテキストの確認**
+    page_text = soup.get_text()
+    for indicator in classifier.OUT_OF_STOCK_INDICATORS:
+        if indicator in page_text:
+            print(f"在庫なしと判断しました。（「{indicator}」が見つかったため）")
+            return "在庫なし"
+
+    # **最後の手段として価格表示を確認（ただし、上記の在庫なし条件をクリアした場合のみ）**
+    for selector in classifier.PRICE_SELECTORS:
+        price_element = soup.find("p", selector) or soup.find("span", selector) or soup.find("div", selector)
+        if price_element and price_element.text.strip() and "円" in price_element.text:
+            # 価格が表示されているが、上記の在庫確認で在庫なしの兆候がない場合のみ在庫ありとする
+            print(f"在庫ありと判断しました。（価格要素が見つかり、在庫なしの兆候がないため: {selector}）")
+            return "在庫あり"
+
+    print("在庫状況を判定できませんでした。デフォルトで在庫なしとします。")
+    return "在庫なし"
+
+def classify_legacy(html, product_url):
+    """従来の方式（soup.find の連続呼び出し）で判定する
+
+    StockClassifier と同じパーサーを使い、走査の方式の違いだけを比較する。
+    """
+    soup = BeautifulSoup(html, config.HTML_PARSER)
+    return legacy_product_name(soup, product_url), legacy_stock_status(soup)
+
+def classify_single_pass(html, product_url):
+    """StockClassifier で判定する"""
+    soup = BeautifulSoup(html, config.HTML_PARSER)
+    result = classifier.stock_classifier.classify(soup, product_url)
+    return result.name, result.status
+
+def bench_classify(args):
+    """保存済みページの解析+判定時間を比較し、判定結果が期待値と一致するか確認する"""
+    pages = load_fixture_pages()
+    product_url = "https://www.ci-medical.com/dental/catalog_item/801Y880"
+    mismatches = 0
+
+    print(f"パーサー: {config.HTML_PARSER}（従来の方式と StockClassifier で共通）")
+    print(f"{'ページ':<24}{'従来(ms)':>10}{'1回走査(ms)':>14}  判定ルール")
+
+    total_legacy = 0.0
+    total_single = 0.0
+    for filename, html, expected in pages:
+        # 従来の方式は判定のたびに print するため、計測中は出力を捨てる
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                legacy = classify_legacy(html, product_url)
+            legacy_elapsed = (time.perf_counter() - start) / args.iterations
+
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            single = classify_single_pass(html, product_url)
+        single_elapsed = (time.perf_counter() - start) / args.iterations
+
+        classification = classifier.stock_classifier.classify(
+            BeautifulSoup(html, config.HTML_PARSER), product_url
+        )
+        rule = classification.rule
+        expected_result = (expected["name"], expected["status"])
+        ok = (
+            legacy == expected_result and single == expected_result and rule == expected["rule"]
+            and classification.is_product_page == expected["product_page"]
+            and classification.record.price == expected.get("price")
+        )
+        if not ok:
+            mismatches += 1
+            print(
+                f"  不一致: 期待値={expected_result} ({expected['rule']}, {expected.get('price')}円), "
+                f"従来={legacy}, 1回走査={single} ({rule}, {classification.record.price}円)"
+            )
+
+        total_legacy += legacy_elapsed
+        total_single += single_elapsed
+        print(f"{filename:<24}{legacy_elapsed * 1000:>10.2f}{single_elapsed * 1000:>14.2f}  {rule}")
+
+    print(f"\n平均: 従来 {total_legacy / len(pages) * 1000:.2f}ms / 1回走査 {total_single / len(pages) * 1000:.2f}ms")
+    mismatches += check_fingerprints(pages)
+    if mismatches:
+        print(f"判定結果の不一致: {mismatches}件")
+        raise SystemExit(1)
+    print("すべてのページで判定結果が期待値と一致しました。")
+
+def check_fingerprints(pages):
+    """保存済みページの一部を書き換えて、ページのハッシュが判定に使う部分の変化でだけ変わるか確認する
+
+    Returns:
+        int: 期待どおりでなかった件数
+    """
+    from ci_stock_monitor.fetchers.http import page_fingerprint
+
+    html = next(html for filename, html, _ in pages if filename == FINGERPRINT_PAGE)
+    fingerprint = page_fingerprint(html)
+    failures = 0
+    print(f"\nページのハッシュ（{FINGERPRINT_PAGE}）:")
+    for description, before, after, should_change in FINGERPRINT_CASES:
+        changed = page_fingerprint(html.replace(before, after, 1)) != fingerprint
+        ok = before in html and changed == should_change
+        failures += not ok
+        expected = "変わる" if should_change else "変わらない"
+        print(f"  {description:<16} {'変わった' if changed else '変わらなかった'}（期待: {expected}）{'' if ok else '  不一致'}")
+    return failures
+
+def fixture_product_pages(pages, count):
+    """保存済みページを count 件の商品として並べる
+
+    Returns:
+        tuple: (商品ID -> HTML の辞書, 商品ID -> 期待値 の辞書, 商品IDのリスト) のタプル
+    """
+    served = {}
+    expected_by_id = {}
+    product_ids = []
+    for i in range(count):
+        filename, html, expected = pages[i % len(pages)]
+        product_id = f"{os.path.splitext(filename)[0]}-{i}"
+        served[product_id] = html
+        expected_by_id[product_id] = expected
+        product_ids.append(product_id)
+    return served, expected_by_id, product_ids
+
+def expected_check_result(expected, backend):
+    """取得方式ごとに期待される (商品名, 在庫状況) を返す
+
+    HTTP取得では在庫表示要素のないページ（product_page が false）は "エラー: 解析不可" になる。
+    """
+    if backend == "http" and not expected["product_page"]:
+        return None, "エラー: 解析不可"
+    return expected["name"], expected["status"]
+
+def run_offline_setting(base_url, backend, concurrency, product_urls, interval):
+    """1つの取得方式・並行数で商品をチェックし、計測結果を返す
+
+    最大RSSを設定ごとに測れるよう、別プロセスで実行する（Chromeのプロセスは含まない）。
+    ログイン先と認証情報は、bench_offline が設定した環境変数から読み込まれる。
+    """
+    fetchers.rate_limiter.min_interval = interval
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        results = fetchers.check_products(product_urls, backend, concurrency)
+        elapsed = time.perf_counter() - start
+
+    latencies = [result.latency for result in results]
+    return {
+        "results": [(result.url, result.name, result.status) for result in results],
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        # Linuxの ru_maxrss はKB単位
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def bench_offline(args):
+    """保存済みページを返すスタブサーバーに対して、取得方式と並行数ごとの性能を計測する"""
+    pages = load_fixture_pages()
+    served, expected_by_id, product_ids = fixture_product_pages(pages, args.products)
+    server, base_url = stub_server.start_stub_server(pages=served, delay=args.delay)
+    product_urls = [f"{base_url}/dental/catalog_item/{product_id}" for product_id in product_ids]
+    # 計測用のプロセスは設定を読み込み直すため、スタブサーバーのログイン先は環境変数で渡す
+    # （毎回ログインを計測に含め、Cookieの保存ファイルも作らない）
+    os.environ.update(
+        LOGIN_URL=f"{base_url}/accounts/sign_in",
+        CI_MEDICAL_USERNAME=stub_server.STUB_USERNAME,
+        CI_MEDICAL_PASSWORD=stub_server.STUB_PASSWORD,
+        COOKIE_JAR_FILE="",
+    )
+
+    print(f"商品数: {len(product_urls)}（保存済みページ {len(pages)}種類） / 応答の遅延: {args.delay}秒 / パーサー: {config.HTML_PARSER}")
+    print(f"{'取得方式':<10}{'並行数':>6}{'件/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'最大RSS(MB)':>14}{'不一致':>8}")
+
+    rows = []
+    mismatches = 0
+    # 設定ごとに新しいプロセスで実行し、前の設定のメモリ使用量を引き継がないようにする
+    context = multiprocessing.get_context("spawn")
+    try:
+        for backend in args.backends:
+            for concurrency in args.concurrency:
+                with context.Pool(1) as pool:
+                    row = pool.apply(
+                        run_offline_setting, (base_url, backend, concurrency, product_urls, args.interval)
+                    )
+
+                row_mismatches = 0
+                for product_url, name, status in row.pop("results"):
+                    expected = expected_by_id[product_url.rsplit("/", 1)[-1]]
+                    expected_name, expected_status = expected_check_result(expected, backend)
+                    if status != expected_status or (expected_name is not None and name != expected_name):
+                        row_mismatches += 1
+                        print(f"  不一致: {product_url} 期待値=({expected_name}, {expected_status}), 結果=({name}, {status})")
+                mismatches += row_mismatches
+
+                row.update(backend=backend, concurrency=concurrency, products=len(product_urls), mismatches=row_mismatches)
+                rows.append(row)
+                print(
+                    f"{backend:<10}{concurrency:>6}{row['throughput']:>10.1f}{row['p50'] * 1000:>10.1f}"
+                    f"{row['p95'] * 1000:>10.1f}{row['peak_rss_mb']:>14.1f}{row_mismatches:>8}"
+                )
+    finally:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f"計測結果を保存しました: {args.output}")
+
+    if mismatches:
+        print(f"判定結果の不一致: {mismatches}件")
+        raise SystemExit(1)
+    print("すべての商品で判定結果が期待値と一致しました。")
+
+def traced_size(build):
+    """build() の戻り値が確保しているメモリ（バイト）を返す"""
+    tracemalloc.start()
+    try:
+        value = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del value
+    return size
+
+def bench_records(args):
+    """ProductRecord の保持に必要なメモリと、前回の記録との比較の所要時間を計測する"""
+    product_url = "https://www.ci-medical.com/dental/catalog_item/801Y880"
+    templates = []
+    for _, html, _ in load_fixture_pages():
+        with contextlib.redirect_stdout(io.StringIO()):
+            templates.append(classifier.parse_product_page(html, product_url).record)
+
+    # 商品名と価格が商品ごとに異なる count 件の記録を作り、状態ファイルと同じJSONを経由して読み込む
+    previous = [
+        replace(templates[i % len(templates)], name=f"{templates[i % len(templates)].name} #{i}", price=1000 + i)
+        for i in range(args.count)
+    ]
+    text = json.dumps([record.to_dict() for record in previous], ensure_ascii=False)
+    dict_bytes = traced_size(lambda: json.loads(text))
+    record_bytes = traced_size(lambda: [ProductRecord.from_dict(data) for data in json.loads(text)])
+
+    start = time.perf_counter()
+    loaded = [ProductRecord.from_dict(data) for data in json.loads(text)]
+    load_elapsed = time.perf_counter() - start
+
+    # 変化なし（別に読み込んだ同じ内容の記録）と、10件に1件を値下げした場合の比較
+    dropped = set(range(0, args.count, 10))
+    current = [ProductRecord.from_dict(data) for data in json.loads(text)]
+    current = [replace(record, price=record.price - 100) if i in dropped else record for i, record in enumerate(current)]
+
+    start = time.perf_counter()
+    kinds = ("price_drop", "lead_time", "variant_restock")
+    unchanged = sum(len(record.changes(before, kinds)) for record, before in zip(loaded, previous))
+    unchanged_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    changes = sum(len(record.changes(before, kinds)) for record, before in zip(current, loaded))
+    changed_elapsed = time.perf_counter() - start
+
+    print(f"記録数: {args.count}（保存済みページ {len(templates)}種類から作成）")
+    print(f"保持: 辞書 {dict_bytes / 1024 / 1024:.2f}MB（{dict_bytes / args.count:.0f}バイト/件） / "
+          f"ProductRecord {record_bytes / 1024 / 1024:.2f}MB（{record_bytes / args.count:.0f}バイト/件）")
+    print(f"読み込み（JSON + from_dict）: {load_elapsed * 1000:.1f}ms")
+    print(f"比較: 変化なし {unchanged_elapsed * 1000:.1f}ms / 10件に1件値下げ {changed_elapsed * 1000:.1f}ms（変化 {changes}件）")
+
+    if unchanged or changes != len(dropped):
+        print(f"変化の件数が期待値と一致しません: 変化なし {unchanged}件 / 値下げ {changes}件（期待値 {len(dropped)}件）")
+        raise SystemExit(1)
+
+# 起動時間の計測対象: (経路, 読み込むモジュール, 読み込んではいけない重いモジュール)
+STARTUP_SCENARIOS = [
+    ("起動のみ", ["ci_stock_monitor.cli"], ["requests", "bs4", "selenium", "smtplib"]),
+    ("HTTP取得", ["ci_stock_monitor.cli", "ci_stock_monitor.fetchers.http"], ["selenium"]),
+    ("Selenium取得", ["ci_stock_monitor.cli", "ci_stock_monitor.fetchers.browser"], []),
+    ("通知", ["ci_stock_monitor.cli", "ci_stock_monitor.notifiers", "smtplib", "email.mime.text", "requests"], ["selenium", "bs4"]),
+]
+HEAVY_MODULES = ["requests", "bs4", "lxml", "selenium", "smtplib", "sqlite3", "yaml"]
+
+def measure_imports(modules):
+    """新しいインタープリターで modules を読み込み、読み込み時間と読み込まれたモジュールを返す
+
+    Returns:
+        tuple: (-X importtime の累計時間の合計（秒）, プロセスの実行時間（秒）, sys.modules の名前のリスト)
+    """
+    code = (
+        f"import sys, json\nfor name in {modules!r}: __import__(name)\n"
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    wall = time.perf_counter() - start
+
+    # "import time: self [us] | cumulative | imported package" のうち、字下げのない行が最上位の import
+    import_us = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            import_us += int(cumulative)
+    return import_us / 1_000_000, wall, json.loads(completed.stdout)
+
+def bench_startup(args):
+    """経路ごとのモジュール読み込み時間と、読み込まれる重いモジュールを計測する"""
+    print(f"{'経路':<14}{'読み込み(ms)':>14}{'プロセス(ms)':>14}{'モジュール数':>12}  重いモジュール")
+
+    rows = []
+    violations = 0
+    for label, modules, forbidden in STARTUP_SCENARIOS:
+        samples = [measure_imports(modules) for _ in range(args.runs)]
+        loaded = samples[-1][2]
+        heavy = [name for name in HEAVY_MODULES if name in loaded]
+        unexpected = [name for name in forbidden if name in loaded]
+        row = {
+            "scenario": label,
+            "modules": modules,
+            "import_ms": statistics.median(sample[0] for sample in samples) * 1000,
+            "process_ms": statistics.median(sample[1] for sample in samples) * 1000,
+            "module_count": len(loaded),
+            "heavy_modules": heavy,
+            "unexpected": unexpected,
+        }
+        rows.append(row)
+        print(
+            f"{label:<14}{row['import_ms']:>14.1f}{row['process_ms']:>14.1f}{row['module_count']:>12}"
+            f"  {', '.join(heavy) or '-'}"
+        )
+        if unexpected:
+            violations += 1
+            print(f"  この経路では読み込まないはずのモジュール: {', '.join(unexpected)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f"計測結果を保存しました: {args.output}")
+
+    if violations:
+        raise SystemExit(1)
+    print("すべての経路で、使わない取得方式・通知のモジュールは読み込まれていません。")
+
+def main():
+    parser = argparse.ArgumentParser(description="ci_stock_monitor の性能計測")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    session_parser = subparsers.add_parser("session", help="ログインセッション使い回しの効果を計測")
+    session_parser.add_argument("--limit", type=int, default=0, help="計測する商品数（0の場合は全商品）")
+    session_parser.set_defaults(func=bench_session)
+
+    classify_parser = subparsers.add_parser("classify", help="保存済みページの解析+判定時間を計測")
+    classify_parser.add_argument("--iterations", type=int, default=20, help="1ページあたりの繰り返し回数")
+    classify_parser.set_defaults(func=bench_classify)
+
+    profile_parser = subparsers.add_parser("profile", help="Chromeプロファイルごとの読み込み時間と転送量を計測")
+    profile_parser.add_argument("--limit", type=int, default=0, help="計測する商品数（0の場合は全商品）")
+    profile_parser.set_defaults(func=bench_profile)
+
+    offline_parser = subparsers.add_parser("offline", help="保存済みページを返すスタブサーバーで取得方式・並行数ごとの性能を計測")
+    offline_parser.add_argument("--backends", nargs="+", choices=["http", "selenium", "auto"], default=["http"],
+                                help="計測する取得方式（selenium と auto はChromeが必要）")
+    offline_parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 8], help="計測する並行数")
+    offline_parser.add_argument("--products", type=int, default=100, help="チェックする商品数（保存済みページを繰り返し使う）")
+    offline_parser.add_argument("--delay", type=float, default=0.05, help="スタブサーバーが商品ページを返すまでの待ち時間（秒）")
+    offline_parser.add_argument("--interval", type=float, default=0.0, help="同じホストへのリクエスト間隔（秒）")
+    offline_parser.add_argument("--output", help="計測結果を保存するJSONファイル")
+    offline_parser.set_defaults(func=bench_offline)
+
+    startup_parser = subparsers.add_parser("startup", help="経路ごとのモジュール読み込み時間を計測")
+    startup_parser.add_argument("--runs", type=int, default=5, help="経路ごとの計測回数（中央値を表示）")
+    startup_parser.add_argument("--output", help="計測結果を保存するJSONファイル")
+    startup_parser.set_defaults(func=bench_startup)
+
+    records_parser = subparsers.add_parser("records", help="ProductRecord のメモリ使用量と比較の所要時間を計測")
+    records_parser.add_argument("--count", type=int, default=10000, help="保持する記録の件数")
+    records_parser.set_defaults(func=bench_records)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""CI Medical 在庫監視
+
+- config: 設定（環境変数）
+- classifier: 商品ページの解析と在庫状況の判定
+- records: 商品ページから取り出した商品情報（価格、納期、規格）と、前回からの変化
+- fetchers: 商品ページの取得（http: requests / browser: Selenium）
+- state: 在庫状況、ジャーナル、チェック間隔、在庫履歴の保存
+- notifiers: メール / LINE 通知
+- runner / daemon / cli: 1回分のチェック、常駐モード、コマンドライン
+
+起動を速くするため、このパッケージを読み込んだだけではどのモジュールも読み込まない。
+Selenium、BeautifulSoup、requests、smtplib は、それを使う処理が実際に選ばれた時点で読み込む。
+"""
@@ -0,0 +1,396 @@
+"""商品ページ・一覧ページの解析と在庫状況の判定（BeautifulSoup）"""
+import re
+from collections import namedtuple
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, Tag
+
+from .config import HTML_PARSER
+from .metrics import metrics
+from .records import ProductRecord, Variant, intern_label
+from .watchlist import PRODUCT_LINK_PATTERN
+
+# 商品名を探すセレクタ（優先順）
+NAME_SELECTORS = [
+    # h1タグのパターン
+    ("h1", {"class": "product-title"}),
+    ("h1", {"class": "item-title"}),
+    ("h1", {"class": "product-name"}),
+    ("h1", {"class": "title"}),
+    ("h1", {"class": "item-name"}),
+    ("h1", None),
+    # h2タグのパターン
+    ("h2", {"class": "product-title"}),
+    ("h2", {"class": "item-title"}),
+    ("h2", {"class": "product-name"}),
+    # divタグのパターン
+    ("div", {"class": "product-title"}),
+    ("div", {"class": "product-name"}),
+    ("div", {"class": "item-name"}),
+    ("div", {"class": "item-title"}),
+    ("div", {"class": "product-title__txt"}),
+    ("div", {"class": "product-detail-title"}),
+    # spanタグのパターン
+    ("span", {"class": "product-title"}),
+    ("span", {"class": "item-title"}),
+    ("span", {"class": "product-name"}),
+    # pタグのパターン
+    ("p", {"class": "product-title"}),
+    ("p", {"class": "product-name"}),
+]
+
+# 「買い物カゴに入れる」ボタンのクラス（a または button タグ）
+CART_BUTTON_SELECTORS = [
+    {"class": "button-cart"},
+    {"class": "btn-cart"},
+    {"class": "add-to-cart"},
+    {"class": "cart-button"},
+]
+
+# 在庫なしを示すテキスト
+OUT_OF_STOCK_INDICATORS = [
+    "在庫なし", "品切れ", "売り切れ", "完売", "Out of Stock", "Sold Out"
+]
+
+# 価格表示のクラス（p, span, div タグ）
+PRICE_SELECTORS = [
+    {"class": "product-price__txt"},
+    {"class": "item-price__num"},
+    {"class": "price"},
+    {"class": "item-price"},
+]
+
+# 数量・納期（出荷目安、入荷予定など）の表示のクラス（p, span, div タグ。優先順）
+LEAD_TIME_SELECTORS = [
+    {"class": "product-stock__delivery"},
+    {"class": "product-delivery"},
+    {"class": "delivery-date"},
+    {"class": "shipping-date"},
+    {"class": "product-stock__note"},
+]
+
+# 規格（サイズ、入数など）ごとの価格・在庫の一覧のクラス（table, ul, div タグ）
+VARIANT_SELECTORS = [
+    {"class": "product-variation"},
+    {"class": "variation-table"},
+    {"class": "item-variation"},
+    {"class": "product-sku"},
+]
+
+PRICE_PATTERN = re.compile(r"([0-9][0-9,]*)\s*円")
+QUANTITY_PATTERN = re.compile(r"(?:残り|在庫数?)\s*[:：]?\s*([0-9]+)")
+# 在庫表示の中の納期・入荷予定（専用の要素がない場合に使う）
+LEAD_TIME_PATTERN = re.compile(r"(?:出荷|発送|お届け|入荷予定|納期)[^。\n）)]*")
+
+def parse_price(text):
+    """「1,320円（税込）」のような表示から価格（円）を取り出す（価格がない場合は None）"""
+    match = PRICE_PATTERN.search(text)
+    return int(match.group(1).replace(",", "")) if match else None
+
+Classification = namedtuple(
+    "Classification", ["name", "name_rule", "status", "rule", "detail", "is_product_page", "record"]
+)
+
+class StockClassifier:
+    """商品ページを1回だけ走査して、商品名と在庫状況を判定する
+
+    NAME_SELECTORS などのセレクタ一覧から、記録すべき (タグ, クラス) の表を事前に組み立てておき、
+    走査中はそれぞれに最初に一致した要素だけを記録する。判定の優先順位と条件は
+    従来の soup.find を順に呼び出す判定（benchmark.py の classify_legacy）と同じで、どのルールで判定したかも返す。
+    """
+
+    def __init__(self):
+        # タグ名 -> 記録するクラス名の集合（None はクラスを問わず最初の要素）
+        self.watched = {}
+        for tag, attrs in NAME_SELECTORS:
+            self._watch(tag, attrs["class"] if attrs else None)
+        self._watch("span", "product-stock__status")
+        self._watch("a", "button-cart")
+        self._watch("div", "product-form")
+        for selector in CART_BUTTON_SELECTORS:
+            for tag in ("a", "button"):
+                self._watch(tag, selector["class"])
+        for selector in PRICE_SELECTORS + LEAD_TIME_SELECTORS:
+            for tag in ("p", "span", "div"):
+                self._watch(tag, selector["class"])
+        self._watch("div", "product-stock")
+        for selector in VARIANT_SELECTORS:
+            for tag in ("table", "ul", "div"):
+                self._watch(tag, selector["class"])
+        self._watch("title", None)
+
+    def _watch(self, tag, class_name):
+        self.watched.setdefault(tag, set()).add(class_name)
+
+    def scan(self, soup):
+        """文書を1回走査し、判定に必要な要素とページテキストを集める
+
+        Returns:
+            tuple: ((タグ, クラス) -> 最初の要素, 全h1タグ, og:titleメタタグ, ページテキスト)
+        """
+        first = {}
+        h1_tags = []
+        og_title = None
+        texts = []
+        string_types = soup.interesting_string_types
+
+        for node in soup.descendants:
+            node_type = type(node)
+            if node_type is Tag:
+                name = node.name
+                watched = self.watched.get(name)
+                if watched is not None:
+                    if None in watched and (name, None) not in first:
+                        first[(name, None)] = node
+                    for class_name in node.get("class") or ():
+                        if class_name in watched and (name, class_name) not in first:
+                            first[(name, class_name)] = node
+                if name == "h1":
+                    h1_tags.append(node)
+                elif name == "meta" and og_title is None and node.get("property") == "og:title":
+                    og_title = node
+            elif node_type in string_types:
+                texts.append(node)
+
+        return first, h1_tags, og_title, "".join(texts)
+
+    def classify(self, soup, product_url):
+        """商品名と在庫状況を判定し、商品の情報（価格、在庫表示、数量・納期、規格）を取り出す
+
+        Returns:
+            Classification: 商品名、在庫状況と、それぞれを判定したルール、ProductRecord
+        """
+        first, h1_tags, og_title, page_text = self.scan(soup)
+        name, name_rule = self._classify_name(first, h1_tags, og_title, product_url)
+        status, rule, detail = self._classify_stock(first, page_text)
+        is_product_page = (
+            ("span", "product-stock__status") in first
+            or ("a", "button-cart") in first
+            or ("div", "product-form") in first
+        )
+        record = self._extract_record(first, name)
+        return Classification(name, name_rule, status, rule, detail, is_product_page, record)
+
+    def _classify_name(self, first, h1_tags, og_title, product_url):
+        for tag, attrs in NAME_SELECTORS:
+            class_name = attrs["class"] if attrs else None
+            element = first.get((tag, class_name))
+            if element:
+                product_name = " ".join(element.text.split())
+                # 商品名として有効か確認（長さが3文字以上、URLでない）
+                if product_name and len(product_name) >= 3 and "http" not in product_name.lower():
+                    return product_name, f"{tag}.{class_name}" if class_name else tag
+
+        # OGPメタタグ
+        if og_title and og_title.get("content"):
+            product_name = og_title["content"].strip()
+            if product_name:
+                return product_name, "og:title"
+
+        # ページタイトル（例: "商品名 | サイト名"）
+        title_tag = first.get(("title", None))
+        if title_tag:
+            title_text = title_tag.text.strip()
+            if " | " in title_text:
+                product_name = title_text.split(" | ")[0].strip()
+            elif " - " in title_text:
+                product_name = title_text.split(" - ")[0].strip()
+            else:
+                product_name = title_text
+            if product_name and len(product_name) >= 3:
+                return product_name, "title"
+
+        h1_summary = ", ".join(
+            f"クラス={h1.get('class')}, テキスト={h1.text.strip()[:50]}" for h1 in h1_tags[:3]
+        )
+        product_id = product_url.split("/")[-1]
+        return f"商品ID: {product_id}", f"product-id (h1: {len(h1_tags)}件 {h1_summary})"
+
+    def _classify_stock(self, first, page_text):
+        # 在庫状況表示
+        element = first.get(("span", "product-stock__status"))
+        if element:
+            stock_text = element.text.strip()
+            stock_classes = element.get("class", [])
+            if "在庫なし" in stock_text or "is-soldout" in stock_classes:
+                return "在庫なし", "stock-status", f"在庫状況表示: {stock_text}, クラス: {stock_classes}"
+            elif "在庫あり" in stock_text:
+                return "在庫あり", "stock-status", f"在庫状況表示: {stock_text}"
+
+        # 「在庫なし」ボタン
+        element = first.get(("a", "button-cart"))
+        if element:
+            button_text = element.text.strip()
+            button_classes = element.get("class", [])
+            if "在庫なし" in button_text or "button-cart--disabled" in button_classes:
+                return "在庫なし", "cart-button", f"ボタン表示: {button_text}, クラス: {button_classes}"
+            elif "買い物カゴ" in button_text or "カート" in button_text:
+                return "在庫あり", "cart-button", f"ボタン表示: {button_text}"
+
+        # 購入フォームの状態
+        element = first.get(("div", "product-form"))
+        if element:
+            form_classes = element.get("class", [])
+            if "is-disabled" in form_classes:
+                return "在庫なし", "product-form", f"購入フォームが無効化されているため: {form_classes}"
+
+        # 「買い物カゴに入れる」ボタン（より広範囲）
+        for selector in CART_BUTTON_SELECTORS:
+            class_name = selector["class"]
+            element = first.get(("a", class_name)) or first.get(("button", class_name))
+            if element:
+                button_text = element.text.strip()
+                if "買い物カゴ" in button_text or "カート" in button_text:
+                    return "在庫あり", f"cart-selector:{class_name}", f"ボタン表示: {button_text}"
+
+        # 在庫なしを示すテキスト
+        for indicator in OUT_OF_STOCK_INDICATORS:
+            if indicator in page_text:
+                return "在庫なし", f"out-of-stock-text:{indicator}", f"「{indicator}」が見つかったため"
+
+        # 価格表示（上記の在庫なし条件をクリアした場合のみ在庫ありとする）
+        for selector in PRICE_SELECTORS:
+            class_name = selector["class"]
+            element = (
+                first.get(("p", class_name))
+                or first.get(("span", class_name))
+                or first.get(("div", class_name))
+            )
+            if element and element.text.strip() and "円" in element.text:
+                return "在庫あり", f"price:{class_name}", "価格要素が見つかり、在庫なしの兆候がないため"
+
+        return "在庫なし", "default", "在庫状況を判定できなかったため"
+
+    def _first_of(self, first, selectors, tags):
+        """selectors の優先順に、tags のいずれかで最初に見つかった要素を返す"""
+        for selector in selectors:
+            for tag in tags:
+                element = first.get((tag, selector["class"]))
+                if element:
+                    return element
+        return None
+
+    def _extract_record(self, first, name):
+        price = None
+        for selector in PRICE_SELECTORS:
+            element = self._first_of(first, [selector], ("p", "span", "div"))
+            if element:
+                price = parse_price(element.text)
+                if price is not None:
+                    break
+
+        # 在庫状況表示、なければ買い物カゴボタンの表示（「入荷待ち」など）
+        element = first.get(("span", "product-stock__status")) or first.get(("a", "button-cart"))
+        stock_label = " ".join(element.text.split()) if element else None
+
+        element = self._first_of(first, LEAD_TIME_SELECTORS, ("p", "span", "div"))
+        lead_time = " ".join(element.get_text(" ").split()) if element else None
+        element = first.get(("div", "product-stock"))
+        stock_text = " ".join(element.get_text(" ").split()) if element else ""
+        if not lead_time:
+            match = LEAD_TIME_PATTERN.search(stock_text)
+            lead_time = match.group(0).strip() if match else None
+        match = QUANTITY_PATTERN.search(f"{stock_text} {lead_time or ''}")
+        quantity = int(match.group(1)) if match else None
+
+        element = self._first_of(first, VARIANT_SELECTORS, ("table", "ul", "div"))
+        variants = self._extract_variants(element) if element else ()
+        return ProductRecord(name, price, intern_label(stock_label), quantity, lead_time, variants)
+
+    def _extract_variants(self, container):
+        """規格の一覧の各行（tr、li、または直下の要素）から、規格名、価格、在庫状況を取り出す"""
+        rows = container.find_all("tr") or container.find_all("li") or container.find_all(recursive=False)
+        variants = []
+        for row in rows:
+            cells = row.find_all(["td", "th"], recursive=False)
+            # 見出し行は読み飛ばす
+            if cells and all(cell.name == "th" for cell in cells):
+                continue
+            row_text = " ".join(row.get_text(" ").split())
+            label = " ".join((cells[0] if cells else row).get_text(" ").split())
+            if not label:
+                continue
+            variants.append(Variant(label, parse_price(row_text), intern_label(self._variant_stock(row, row_text))))
+        return tuple(variants)
+
+    def _variant_stock(self, row, row_text):
+        button = row.find(["a", "button"], class_=True)
+        button_classes = button.get("class", []) if button else []
+        if any(indicator in row_text for indicator in OUT_OF_STOCK_INDICATORS) or any(
+            class_name.endswith("--disabled") for class_name in button_classes
+        ):
+            return "在庫なし"
+        if "在庫あり" in row_text or "買い物カゴ" in row_text or "カート" in row_text:
+            return "在庫あり"
+        return None
+
+stock_classifier = StockClassifier()
+
+def parse_product_page(page_source, product_url):
+    """商品ページのHTMLを解析し、商品名と在庫状況を判定する
+
+    Returns:
+        Classification: 判定結果
+    """
+    with metrics.phase("parse"):
+        soup = BeautifulSoup(page_source, HTML_PARSER)
+    with metrics.phase("classify"):
+        result = stock_classifier.classify(soup, product_url)
+    # 解析木は循環参照を含むため、ガベージコレクションを待たずにすぐ解放する
+    soup.decompose()
+
+    if result.name_rule.startswith("product-id"):
+        print(f"警告: 商品名を取得できませんでした。（{result.name_rule}）")
+    print(f"商品名: {result.name}")
+    print(f"{result.status}と判断しました。（ルール: {result.rule}, {result.detail}）")
+    record = result.record
+    if record.price is not None or record.lead_time or record.variants:
+        price = f"{record.price:,}円" if record.price is not None else "表示なし"
+        print(f"価格: {price} / 納期: {record.lead_time or '表示なし'} / 規格: {len(record.variants)}件")
+    return result
+
+def parse_listing_page(page_source, page_url):
+    """カテゴリー/検索結果ページから商品URLと、一覧の表示で判定できた在庫状況を取り出す
+
+    商品リンクごとに、その商品へのリンクだけを含む最も外側の要素を商品の枠とみなし、
+    枠の中を StockClassifier で判定する。在庫表示要素（在庫状況、買い物カゴボタン、購入フォーム）が
+    枠の中にない商品は、在庫状況を None として商品ページでチェックする。
+
+    Returns:
+        tuple: ([(商品URL, 商品名, 在庫状況, 判定ルール), ...], 次のページのURL) のタプル
+    """
+    soup = BeautifulSoup(page_source, HTML_PARSER)
+
+    # 要素ごとに、中に含まれる商品リンクの商品IDを集める
+    links = {}
+    contained = {}
+    for link in soup.find_all("a", href=True):
+        match = PRODUCT_LINK_PATTERN.search(link["href"])
+        if not match:
+            continue
+        product_id = match.group(1)
+        links.setdefault(product_id, []).append(link)
+        for parent in link.parents:
+            contained.setdefault(id(parent), set()).add(product_id)
+
+    products = []
+    for product_id, product_links in links.items():
+        product_url = urljoin(page_url, product_links[0]["href"].split("#")[0])
+        card = None
+        for parent in product_links[0].parents:
+            if contained[id(parent)] != {product_id}:
+                break
+            card = parent
+
+        link_text = max((" ".join(link.get_text().split()) for link in product_links), key=len)
+        name, status, rule = link_text or f"商品ID: {product_id}", None, None
+        if card is not None:
+            result = stock_classifier.classify(card, product_url)
+            if result.is_product_page:
+                status, rule = result.status, f"listing:{result.rule}"
+        products.append((product_url, name, status, rule))
+
+    next_link = soup.find(["a", "link"], rel="next", href=True)
+    next_url = urljoin(page_url, next_link["href"]) if next_link else None
+    soup.decompose()
+    return products, next_url
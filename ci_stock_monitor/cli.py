@@ -0,0 +1,144 @@
+"""コマンドラインの入口（python stock_monitor.py または python -m ci_stock_monitor）"""
+import argparse
+import os
+
+from .config import (
+    BROWSER_PROFILE, CONCURRENCY, CONTROL_HOST, CONTROL_PORT, COOKIE_JAR_FILE, FETCH_BACKEND, HISTORY_FILE,
+    METRICS_FILE, RUN_REPORT_FILE, SCHEDULE_FILE, STATE_DIR, WATCHLIST_FILE,
+)
+from .fetchers.cookies import cookie_store
+from .runner import merge_shards, run_once
+from .state import PollScheduler, print_history_report, state_path
+from .watchlist import load_watch_items, parse_shard, select_shard
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description="CI Medical 在庫監視")
+    parser.add_argument(
+        "--backend",
+        choices=["auto", "http", "selenium"],
+        default=FETCH_BACKEND,
+        help="商品ページの取得方式（auto: HTTPで取得し、失敗時のみSelenium）",
+    )
+    parser.add_argument(
+        "--browser-profile",
+        choices=["standard", "lean"],
+        default=BROWSER_PROFILE,
+        help="Chromeのプロファイル（lean: 画像・フォント・解析/広告を読み込まない）",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY,
+        help="並行してチェックする商品数",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="条件付き取得用のキャッシュを使わず、すべての商品ページを取得・判定し直す",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="チェック間隔に関係なく、すべての商品をチェックする",
+    )
+    parser.add_argument(
+        "--max-products",
+        type=int,
+        default=None,
+        help="1回の実行でチェックする商品数の上限（予定時刻を最も過ぎている商品を優先）",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="終了せずに、チェック時刻を迎えた商品を繰り返しチェックする",
+    )
+    parser.add_argument(
+        "--control-host",
+        default=CONTROL_HOST,
+        help="常駐モードの制御用HTTPサーバーのアドレス（状態の確認、即時チェック、ヘルスチェック、メトリクス）",
+    )
+    parser.add_argument(
+        "--control-port",
+        type=int,
+        default=CONTROL_PORT,
+        help="常駐モードの制御用HTTPサーバーのポート（0で起動しない）",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="途中で終了した前回の実行を再開せず、最初からチェックし直す",
+    )
+    parser.add_argument(
+        "--history",
+        action="store_true",
+        help="チェックせずに、商品ごとの在庫履歴の要約（最後に在庫ありだった時刻、再入荷回数、平均在庫期間）を表示する",
+    )
+    parser.add_argument(
+        "--report",
+        default=RUN_REPORT_FILE,
+        help="段階ごとの所要時間と商品ごとの判定結果を記録するJSONファイル（空文字で出力しない）",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=METRICS_FILE,
+        help="実行レポートをPrometheusのテキスト形式でも書き出すファイル（node_exporter の textfile collector 用）",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="監視リストを商品IDのハッシュでN個に分け、i番目だけをチェックする（例: 1/4）。"
+             "通知は送らずに状態変化を --state-dir に書き出し、--merge でまとめて通知する",
+    )
+    parser.add_argument(
+        "--state-dir",
+        default=STATE_DIR,
+        help="状態ファイル（在庫状況、キャッシュ、スケジュール、履歴、ジャーナル）を置くディレクトリ",
+    )
+    parser.add_argument(
+        "--merge",
+        nargs="+",
+        metavar="SHARD_DIR",
+        help="シャードごとの --state-dir の状態ファイルを1つにまとめ、状態変化をまとめて通知する",
+    )
+    parser.add_argument(
+        "--watchlist",
+        default=WATCHLIST_FILE,
+        help="監視リストのファイル（CSV/YAML/JSON/テキスト。省略時は PRODUCT_URLS）",
+    )
+    parser.add_argument(
+        "--url",
+        action="append",
+        dest="urls",
+        help="監視する商品URL、またはカテゴリー/検索結果ページのURL（複数指定可。指定した場合は監視リストより優先）",
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.state_dir:
+        os.makedirs(args.state_dir, exist_ok=True)
+        if cookie_store.path:
+            cookie_store.path = state_path(args, COOKIE_JAR_FILE)
+    if args.merge:
+        merge_shards(args, args.merge)
+        return
+
+    watch_items = select_shard(load_watch_items(args), args.shard)
+    if args.shard is not None:
+        print(f"シャード {args.shard[0]}/{args.shard[1]}: 監視リストのうち {len(watch_items)}件を担当します。")
+
+    if args.history:
+        print_history_report(
+            [item.url for item in watch_items if item.kind == "product"], state_path(args, HISTORY_FILE)
+        )
+        return
+
+    # 常駐モードでは --all を指定しても、チェック間隔に従う
+    scheduler = PollScheduler(state_path(args, SCHEDULE_FILE)) if args.daemon or not args.all else None
+    if args.daemon:
+        from .daemon import run_daemon
+        run_daemon(args, watch_items, scheduler)
+    else:
+        run_once(args, watch_items, scheduler)
@@ -0,0 +1,148 @@
+"""設定（環境変数から読み込む）
+
+ほかのモジュールから最初に読み込まれるため、標準ライブラリ以外は読み込まない。
+"""
+import importlib.util
+import os
+
+# 設定
+LOGIN_URL = os.getenv("LOGIN_URL", "https://www.ci-medical.com/accounts/sign_in")
+
+# 監視対象商品のリスト
+PRODUCT_URLS = [
+    "https://www.ci-medical.com/dental/catalog_item/801Y880",
+    "https://www.ci-medical.com/dental/catalog_item/801Y697",
+    "https://www.ci-medical.com/dental/catalog_item/801Y168",
+    "https://www.ci-medical.com/dental/catalog_item/801Y774",
+    "https://www.ci-medical.com/dental/catalog_item/801Y594",
+    "https://www.ci-medical.com/dental/catalog_item/801Y202",
+    "https://www.ci-medical.com/dental/catalog_item/801Y173",
+    # 追加商品のURLをここに記載
+    # "https://www.ci-medical.com/dental/catalog_item/商品ID2",
+    # "https://www.ci-medical.com/dental/catalog_item/商品ID3",
+]
+
+# 監視対象をファイル（CSV/YAML/JSON/テキスト）から読み込む場合のパス（空の場合は PRODUCT_URLS）
+WATCHLIST_FILE = os.getenv("WATCHLIST_FILE", "")
+# 監視リストに商品IDだけが書かれている場合の商品URL
+PRODUCT_URL_TEMPLATE = os.getenv("PRODUCT_URL_TEMPLATE", "https://www.ci-medical.com/dental/catalog_item/{id}")
+# カテゴリー/検索結果ページをたどる最大ページ数
+LISTING_MAX_PAGES = int(os.getenv("LISTING_MAX_PAGES", 5))
+
+# ログイン情報 (環境変数から取得することを推奨)
+CI_MEDICAL_USERNAME = os.getenv("CI_MEDICAL_USERNAME")
+CI_MEDICAL_PASSWORD = os.getenv("CI_MEDICAL_PASSWORD")
+
+# 通知設定 (環境変数から取得することを推奨)
+SENDER_EMAIL = os.getenv("SENDER_EMAIL")
+SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
+RECEIVER_EMAIL = os.getenv("RECEIVER_EMAIL")
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() != "false"
+
+# LINE通知設定
+LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
+LINE_USER_ID = os.getenv("LINE_USER_ID")  # 特定のユーザーに送る場合（オプション）
+LINE_API_BASE = os.getenv("LINE_API_BASE", "https://api.line.me")
+LINE_MAX_MESSAGES_PER_REQUEST = 5
+LINE_MAX_TEXT_LENGTH = 5000
+
+# 通知チャネル（監視リストで商品ごとに絞り込める）
+NOTIFY_CHANNELS = ("email", "line")
+
+# 通知送信のタイムアウト（秒）と、LINEの429/5xxを再送する回数・バックオフの基準秒数
+NOTIFY_TIMEOUT = int(os.getenv("NOTIFY_TIMEOUT", 30))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 3))
+NOTIFY_BACKOFF = float(os.getenv("NOTIFY_BACKOFF", 1.0))
+
+# 取得方式: "auto"（HTTPで取得し、失敗時のみSelenium）, "http", "selenium"
+FETCH_BACKEND = os.getenv("FETCH_BACKEND", "auto")
+HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", 30))
+HTTP_POOL_SIZE = 10
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# 商品ページ取得の再試行（通信エラー、タイムアウト、5xx/429のみ。ゆらぎ付きの指数バックオフ）
+FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", 2))
+FETCH_BACKOFF = float(os.getenv("FETCH_BACKOFF", 2.0))
+# 同じホストで通信エラーが続けてこの回数に達したら、CIRCUIT_RESET_TIMEOUT 秒は取得を試みずにエラーとする
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = int(os.getenv("CIRCUIT_RESET_TIMEOUT", 300))
+
+# 並行して確認する商品数と、同じホストへのリクエスト間隔（秒）
+CONCURRENCY = int(os.getenv("CONCURRENCY", 4))
+REQUEST_INTERVAL = float(os.getenv("REQUEST_INTERVAL", 0.5))
+
+# HTML解析に使うパーサー（lxmlがインストールされていれば高速なlxmlを使う）
+# （設定を読み込むだけでlxmlを読み込まないよう、インストールされているかだけを調べる）
+HTML_PARSER = os.getenv("HTML_PARSER", "lxml" if importlib.util.find_spec("lxml") else "html.parser")
+
+# 以前の在庫状況を保存するファイル
+LAST_STATUS_FILE = "last_stock_status.json"
+
+# 状態ファイルを置くディレクトリ（空の場合はカレントディレクトリ）
+STATE_DIR = os.getenv("STATE_DIR", "")
+# シャード実行で、通知せずに状態変化を書き出しておくファイル（マージ時にまとめて通知する）
+PENDING_NOTIFICATIONS_FILE = "pending_notifications.json"
+
+# 商品ページの条件付き取得用キャッシュ（ETag/Last-Modifiedとページのハッシュ）
+FETCH_CACHE_FILE = os.getenv("FETCH_CACHE_FILE", "fetch_cache.json")
+
+# ログイン済みセッションのCookieを実行をまたいで保存するファイル（空の場合は保存しない）と暗号化キー
+COOKIE_JAR_FILE = os.getenv("COOKIE_JAR_FILE", "session_cookies.json")
+COOKIE_JAR_KEY = os.getenv("COOKIE_JAR_KEY", "")
+# 保存したセッションが有効かを確かめるURL（ログインページの場合は、ログイン済みならリダイレクトされる）
+AUTH_PROBE_URL = os.getenv("AUTH_PROBE_URL", LOGIN_URL)
+
+# 在庫状況の変化を確定させるのに必要な連続観測回数（表示が不安定なページで通知が繰り返されないように）
+RESTOCK_CONFIRMATIONS = int(os.getenv("RESTOCK_CONFIRMATIONS", 1))
+SOLDOUT_CONFIRMATIONS = int(os.getenv("SOLDOUT_CONFIRMATIONS", 2))
+ERROR_CONFIRMATIONS = int(os.getenv("ERROR_CONFIRMATIONS", 2))
+
+# 在庫状況の変化のほかに通知する商品情報の変化（カンマ区切り。空の場合は通知しない）
+# price_drop: 値下げ / lead_time: 納期・入荷予定の表示の変化 / variant_restock: 規格ごとの入荷
+CHANGE_EVENTS = tuple(
+    event.strip() for event in os.getenv("CHANGE_EVENTS", "price_drop,lead_time,variant_restock").split(",")
+    if event.strip()
+)
+
+# チェック結果の履歴を追記するSQLiteデータベース
+HISTORY_FILE = os.getenv("HISTORY_FILE", "stock_history.sqlite3")
+
+# 実行レポート（JSON）と、Prometheusのテキスト形式のメトリクスの出力先（空の場合は出力しない）
+RUN_REPORT_FILE = os.getenv("RUN_REPORT_FILE", "run_report.json")
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+# 商品ごとの所要時間（URLをラベルにした系列）もメトリクスに出力する（系列数が商品数だけ増えるため、デフォルトは出力しない）
+METRICS_PRODUCT_LATENCY = os.getenv("METRICS_PRODUCT_LATENCY", "false").lower() == "true"
+# 実行レポートに含める商品ごとの記録の件数（所要時間の長い順）と、p50/p95 の計算に残す段階ごとの所要時間の件数
+REPORT_PRODUCTS = int(os.getenv("REPORT_PRODUCTS", 20))
+PHASE_SAMPLES = int(os.getenv("PHASE_SAMPLES", 1000))
+
+# 商品ごとの次回チェック時刻を保存するファイルと、チェック間隔の設定（秒）
+SCHEDULE_FILE = os.getenv("SCHEDULE_FILE", "schedule_state.json")
+MIN_POLL_INTERVAL = int(os.getenv("MIN_POLL_INTERVAL", 3600))
+MAX_POLL_INTERVAL = int(os.getenv("MAX_POLL_INTERVAL", 6 * 3600))
+POLL_BACKOFF = float(os.getenv("POLL_BACKOFF", 2.0))
+# 在庫状況が変わってからこの期間（秒）は最短間隔でチェックする
+HOT_PERIOD = int(os.getenv("HOT_PERIOD", 3 * 24 * 3600))
+# 定期実行の開始時刻のずれを吸収するため、次回チェック時刻のこの秒数前から対象にする
+SCHEDULE_TOLERANCE = int(os.getenv("SCHEDULE_TOLERANCE", 300))
+
+# チェック結果を1件ずつ追記するジャーナル。途中で終了した実行は、この秒数以内であれば続きから再開する
+JOURNAL_FILE = os.getenv("JOURNAL_FILE", "run_journal.jsonl")
+RESUME_WINDOW = int(os.getenv("RESUME_WINDOW", MIN_POLL_INTERVAL))
+IMMEDIATE_JOURNAL_FILE = "immediate_journal.jsonl"
+
+# 常駐モードの制御用HTTPサーバー（状態の確認、即時チェック、ヘルスチェック、メトリクス）
+CONTROL_HOST = os.getenv("CONTROL_HOST", "127.0.0.1")
+CONTROL_PORT = int(os.getenv("CONTROL_PORT", 8765))
+# 指定した場合、/health 以外は Authorization: Bearer <CONTROL_TOKEN> が必要
+CONTROL_TOKEN = os.getenv("CONTROL_TOKEN", "")
+# 即時チェックの結果を待つ最長時間（秒）
+CONTROL_WAIT_TIMEOUT = int(os.getenv("CONTROL_WAIT_TIMEOUT", 300))
+
+# Chromeで在庫状況表示または買い物カゴボタンが現れるまで待つ最長時間（秒）
+PAGE_READY_TIMEOUT = int(os.getenv("PAGE_READY_TIMEOUT", 15))
+
+# Chromeのプロファイル: "standard"（すべて読み込む）, "lean"（画像・フォント・動画・解析/広告を読み込まない）
+BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "standard")
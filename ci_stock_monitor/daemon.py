@@ -0,0 +1,344 @@
+"""常駐モード（ログイン済みのセッションを保持したチェックの繰り返しと、制御用HTTPサーバー）"""
+import hmac
+import json
+import queue
+import signal
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .config import (
+    CONTROL_HOST, CONTROL_PORT, CONTROL_TOKEN, CONTROL_WAIT_TIMEOUT, LAST_STATUS_FILE, PRODUCT_URL_TEMPLATE,
+    SCHEDULE_TOLERANCE,
+)
+from .fetchers import BrowserPool
+from .fetchers.http import HttpSession
+from .metrics import metrics, percentile, prometheus_labels
+from .runner import run_once
+from .state import load_last_status, state_path
+from .watchlist import make_watch_item
+
+class MonitorDaemon:
+    """常駐モード: ログイン済みのHTTPセッションとChromeを保持したまま、チェックを繰り返す
+
+    チェックは run() を呼んだスレッドで1回ずつ順番に行う。制御用HTTPサーバーから受け付けた
+    即時チェックは、待機中でもすぐに（チェック中の場合はその直後に）、チェック時刻に関係なく行う。
+    """
+
+    def __init__(self, args, watch_items, scheduler):
+        self.args = args
+        self.watch_items = watch_items
+        self.scheduler = scheduler
+        self.http_session = HttpSession()
+        self.browser_pool = BrowserPool(max(1, args.concurrency), args.browser_profile)
+        # 直近の定期チェックで監視対象だった商品（一覧ページから展開した商品を含む）
+        self.items = {item.url: item for item in watch_items if item.kind == "product"}
+        # 即時チェックした監視対象外の商品（直近100件。/status に含める）
+        self.immediate_items = {}
+        # 即時チェックの要求（URL, 結果を受け取る Future, 要求時刻）
+        self.requests = queue.Queue()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+
+        self.started_at = time.time()
+        self.state = "starting"
+        self.cycles = 0
+        self.immediate_checks = 0
+        self.errors = 0
+        self.last_cycle_at = None
+        self.next_cycle_at = None
+        self.last_error = None
+        self.last_report = None
+        # 即時チェックの要求から結果が出るまでの秒数（直近100件）
+        self.immediate_latencies = deque(maxlen=100)
+
+    def request_check(self, item):
+        """商品の即時チェックを予約する
+
+        Returns:
+            Future: チェックが終わるとその商品の結果（metrics の商品ごとの記録）が設定される
+        """
+        future = Future()
+        self.requests.put((item, future, time.perf_counter()))
+        self.wake.set()
+        return future
+
+    def stop(self):
+        """チェック中の場合はそのチェックが終わってから、常駐モードを終了させる"""
+        self.stopping.set()
+        self.wake.set()
+
+    def take_requests(self):
+        """予約された即時チェックをすべて取り出す"""
+        requests = []
+        while True:
+            try:
+                requests.append(self.requests.get_nowait())
+            except queue.Empty:
+                return requests
+
+    def run(self):
+        """停止するまでチェックを繰り返す"""
+        print("常駐モードで起動しました。")
+        next_cycle = 0
+        try:
+            while not self.stopping.is_set():
+                self.wake.clear()
+                requests = self.take_requests()
+                if requests:
+                    self.run_immediate(requests)
+                elif time.time() >= next_cycle:
+                    wait = self.run_cycle()
+                    next_cycle = time.time() + wait
+                    self.next_cycle_at = next_cycle
+                    print(f"次のチェックまで {wait:.0f}秒 待機します。")
+                else:
+                    self.state = "waiting"
+                    self.wake.wait(next_cycle - time.time())
+        finally:
+            self.state = "stopping"
+            for _, future, _ in self.take_requests():
+                future.cancel()
+            self.http_session.close()
+            self.browser_pool.close()
+
+    def run_cycle(self):
+        """チェック時刻を迎えた商品をチェックし、次のチェックまでの待機時間（秒）を返す"""
+        self.state = "checking"
+        try:
+            items, report = run_once(self.args, self.watch_items, self.scheduler, self.http_session, self.browser_pool)
+        except Exception as e:
+            # 1回のチェックが失敗しても常駐モードは終了せず、最短の待機時間の後にやり直す
+            print(f"チェック中にエラーが発生しました: {e}")
+            traceback.print_exc()
+            self.errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            return 30
+
+        self.items = {item.url: item for item in items}
+        self.cycles += 1
+        self.last_cycle_at = time.time()
+        self.last_error = None
+        self.last_report = report
+        # 次にチェック時刻を迎える商品まで待機する（最短30秒、最長は最短チェック間隔）
+        wait = self.scheduler.next_due_time(list(self.items)) - SCHEDULE_TOLERANCE - time.time()
+        return min(max(wait, 30), self.scheduler.min_interval)
+
+    def run_immediate(self, requests):
+        """予約された商品をチェック時刻に関係なくチェックし、要求元に結果を返す"""
+        self.state = "checking"
+        items = {}
+        for item, _, _ in requests:
+            items.setdefault(item.url, self.items.get(item.url, item))
+        print(f"即時チェック: {len(items)}件")
+        try:
+            _, report = run_once(
+                self.args, list(items.values()), self.scheduler, self.http_session, self.browser_pool, immediate=True
+            )
+        except Exception as e:
+            print(f"即時チェック中にエラーが発生しました: {e}")
+            traceback.print_exc()
+            self.errors += 1
+            for _, future, _ in requests:
+                future.set_exception(e)
+            return
+
+        for url, item in items.items():
+            if url not in self.items:
+                self.immediate_items.pop(url, None)
+                self.immediate_items[url] = item
+        while len(self.immediate_items) > 100:
+            del self.immediate_items[next(iter(self.immediate_items))]
+
+        results = {record["url"]: record for record in report["products"]}
+        now = time.perf_counter()
+        for item, future, requested_at in requests:
+            self.immediate_checks += 1
+            self.immediate_latencies.append(now - requested_at)
+            future.set_result(results.get(item.url))
+
+    def health(self):
+        """ヘルスチェックの結果を返す（直近の定期チェックが失敗した場合、または予定より大幅に遅れている場合は異常）"""
+        now = time.time()
+        healthy = self.last_error is None and not self.stopping.is_set()
+        if self.next_cycle_at is not None and self.state == "waiting":
+            healthy = healthy and now < self.next_cycle_at + self.scheduler.min_interval
+        return {
+            "status": "ok" if healthy else "error",
+            "state": self.state,
+            "uptime": now - self.started_at,
+            "cycles": self.cycles,
+            "last_cycle_at": self.last_cycle_at,
+            "last_error": self.last_error,
+            "browsers_running": sum(1 for session in self.browser_pool.sessions if session.driver),
+            "http_logged_in": self.http_session.logged_in,
+        }
+
+    def status(self):
+        """商品ごとの在庫状況と次回チェック時刻を返す（監視対象外で即時チェックした商品を含む）"""
+        last_status = load_last_status(state_path(self.args, LAST_STATUS_FILE))
+        schedule = dict(self.scheduler.entries)
+        products = []
+        urls = list(self.items) + [url for url in self.immediate_items if url not in self.items]
+        for url in urls:
+            entry = last_status.get(url, {})
+            schedule_entry = schedule.get(url, {})
+            products.append({
+                "url": url,
+                "name": entry.get("name"),
+                "status": entry.get("status"),
+                "stable_status": entry.get("stable_status"),
+                "record": entry.get("record"),
+                "last_check": schedule_entry.get("last_check"),
+                "next_check": schedule_entry.get("next_check"),
+            })
+        return {
+            "state": self.state,
+            "last_cycle_at": self.last_cycle_at,
+            "next_cycle_at": self.next_cycle_at,
+            "queued": self.requests.qsize(),
+            "products": products,
+        }
+
+    def prometheus_text(self):
+        """直近の定期チェックのメトリクスに、常駐モードのメトリクスを加えてPrometheusのテキスト形式で返す"""
+        lines = [
+            "# HELP stock_monitor_daemon_uptime_seconds 常駐モードの起動からの経過時間",
+            "# TYPE stock_monitor_daemon_uptime_seconds gauge",
+            f"stock_monitor_daemon_uptime_seconds {time.time() - self.started_at:.3f}",
+            "# HELP stock_monitor_daemon_cycles_total 常駐モードで完了した定期チェックの回数",
+            "# TYPE stock_monitor_daemon_cycles_total counter",
+            f"stock_monitor_daemon_cycles_total {self.cycles}",
+            "# HELP stock_monitor_daemon_errors_total 常駐モードで失敗したチェックの回数",
+            "# TYPE stock_monitor_daemon_errors_total counter",
+            f"stock_monitor_daemon_errors_total {self.errors}",
+            "# HELP stock_monitor_daemon_immediate_checks_total 即時チェックした商品数",
+            "# TYPE stock_monitor_daemon_immediate_checks_total counter",
+            f"stock_monitor_daemon_immediate_checks_total {self.immediate_checks}",
+            "# HELP stock_monitor_daemon_queue_length 待機中の即時チェックの要求数",
+            "# TYPE stock_monitor_daemon_queue_length gauge",
+            f"stock_monitor_daemon_queue_length {self.requests.qsize()}",
+        ]
+        latencies = list(self.immediate_latencies)
+        if latencies:
+            lines += [
+                "# HELP stock_monitor_daemon_immediate_check_seconds 即時チェックの要求から結果が出るまでの時間（直近100件）",
+                "# TYPE stock_monitor_daemon_immediate_check_seconds summary",
+                f"stock_monitor_daemon_immediate_check_seconds{prometheus_labels(quantile='0.5')} {percentile(latencies, 0.5):.6f}",
+                f"stock_monitor_daemon_immediate_check_seconds{prometheus_labels(quantile='0.95')} {percentile(latencies, 0.95):.6f}",
+                f"stock_monitor_daemon_immediate_check_seconds_sum {sum(latencies):.6f}",
+                f"stock_monitor_daemon_immediate_check_seconds_count {len(latencies)}",
+            ]
+        if self.last_report is not None:
+            lines.append(metrics.prometheus_text(self.last_report).rstrip("\n"))
+        return "\n".join(lines) + "\n"
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """常駐モードの制御用HTTPサーバーのリクエストを処理する
+
+    - GET /health: ヘルスチェック（異常の場合は503）
+    - GET /status: 商品ごとの在庫状況と次回チェック時刻
+    - GET /metrics: Prometheusのテキスト形式のメトリクス
+    - POST /check?id=<商品ID> または ?url=<商品URL>: 即時チェック（wait=1 の場合は結果が出るまで待つ）
+    """
+
+    monitor = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        self.send_text(json.dumps(data, ensure_ascii=False, indent=2), status, "application/json; charset=utf-8")
+
+    def send_text(self, text, status=200, content_type="text/plain; version=0.0.4; charset=utf-8"):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        if not CONTROL_TOKEN:
+            return True
+        return hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {CONTROL_TOKEN}")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            health = self.monitor.health()
+            self.send_json(health, 200 if health["status"] == "ok" else 503)
+        elif not self.authorized():
+            self.send_json({"error": "unauthorized"}, 401)
+        elif path == "/status":
+            self.send_json(self.monitor.status())
+        elif path == "/metrics":
+            self.send_text(self.monitor.prometheus_text())
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if parsed.path != "/check":
+            self.send_json({"error": "not found"}, 404)
+            return
+        if not self.authorized():
+            self.send_json({"error": "unauthorized"}, 401)
+            return
+
+        params = parse_qs(parsed.query)
+        target = (params.get("url") or params.get("id") or [""])[0]
+        try:
+            item = make_watch_item(target, "control API")
+        except ValueError as e:
+            self.send_json({"error": str(e)}, 400)
+            return
+        # ログイン済みのセッションで、監視対象のサイト以外のURLを取得しない
+        allowed_hosts = {urlparse(PRODUCT_URL_TEMPLATE).netloc} | {urlparse(url).netloc for url in self.monitor.items}
+        if item.kind != "product" or urlparse(item.url).netloc not in allowed_hosts:
+            self.send_json({"error": f"監視対象のサイトの商品URLではありません: {item.url}"}, 400)
+            return
+
+        future = self.monitor.request_check(item)
+        if params.get("wait", ["0"])[0] not in ("1", "true"):
+            self.send_json({"url": item.url, "queued": True}, 202)
+            return
+        try:
+            result = future.result(timeout=CONTROL_WAIT_TIMEOUT)
+        except FutureTimeoutError:
+            self.send_json({"url": item.url, "queued": True, "error": "timeout"}, 504)
+        except Exception as e:
+            self.send_json({"url": item.url, "error": f"{type(e).__name__}: {e}"}, 500)
+        else:
+            self.send_json({"url": item.url, "result": result})
+
+def start_control_server(monitor, host=CONTROL_HOST, port=CONTROL_PORT):
+    """制御用HTTPサーバーを別スレッドで起動する"""
+    handler = type("BoundControlRequestHandler", (ControlRequestHandler,), {"monitor": monitor})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"制御用HTTPサーバーを起動しました: http://{host}:{server.server_address[1]}/")
+    return server
+
+def run_daemon(args, watch_items, scheduler):
+    """チェック時刻を迎えた商品を繰り返しチェックする（Ctrl+C または SIGTERM で終了）"""
+    daemon = MonitorDaemon(args, watch_items, scheduler)
+    server = start_control_server(daemon, args.control_host, args.control_port) if args.control_port else None
+    # systemd などからの SIGTERM では、チェック中の商品を終えてから終了する
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    print("常駐モードを終了します。")
@@ -0,0 +1,58 @@
+"""取得エラーの分類"""
+
+class FetchError(Exception):
+    """商品ページの取得・判定の失敗
+
+    原因を kind で分類し、分類ごとに再試行、サーキットブレーカー、通知の扱いを変える。
+    - auth: ログインできない（再試行せず、CIRCUIT_RESET_TIMEOUT 秒はログインし直さない）
+    - network: 通信エラー、タイムアウト、5xx/429（再試行し、サーキットブレーカーに数える）
+    - parse: ページは取得できたが在庫表示を読み取れない（再試行しない）
+    - other: 上記以外（ブラウザの異常は Chrome を起動し直して再試行する）
+    """
+
+    kind = "other"
+    default_label = "その他"
+    default_retryable = False
+
+    def __init__(self, message, label=None, retryable=None):
+        super().__init__(message)
+        self.label = label or self.default_label
+        self.retryable = self.default_retryable if retryable is None else retryable
+
+    @property
+    def status(self):
+        """last_stock_status.json や履歴に記録する在庫状況の文字列"""
+        return f"エラー: {self.label}"
+
+class AuthError(FetchError):
+    kind = "auth"
+    default_label = "ログイン失敗"
+
+class NetworkError(FetchError):
+    kind = "network"
+    default_label = "通信"
+    default_retryable = True
+
+class ParseError(FetchError):
+    kind = "parse"
+    default_label = "解析不可"
+
+class CircuitOpenError(NetworkError):
+    default_label = "サイト停止中"
+    default_retryable = False
+
+# 在庫状況のエラーの表示からエラーの分類を引く（上記にない表示は other）
+ERROR_KINDS = {
+    "ログイン失敗": "auth",
+    "タイムアウト": "network",
+    "通信": "network",
+    "サーバー": "network",
+    "サイト停止中": "network",
+    "解析不可": "parse",
+}
+
+def error_kind(status):
+    """在庫状況の文字列からエラーの分類（auth / network / parse / other）を返す（エラーでなければ None）"""
+    if not status or not status.startswith("エラー"):
+        return None
+    return ERROR_KINDS.get(status.split(": ", 1)[-1], "other")
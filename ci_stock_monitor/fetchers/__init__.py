@@ -0,0 +1,273 @@
+"""商品ページの取得（再試行、サーキットブレーカー、並行チェック）
+
+取得方式ごとの実装は http（requests）と browser（Selenium）にあり、
+その取得方式が実際に使われる時点で読み込む（HTTPだけで足りる実行ではSeleniumを読み込まない）。
+"""
+import functools
+import queue
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlparse
+
+from ..config import (
+    BROWSER_PROFILE, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, CONCURRENCY, FETCH_BACKOFF,
+    FETCH_MAX_RETRIES, REQUEST_INTERVAL,
+)
+from ..errors import AuthError, CircuitOpenError, FetchError, NetworkError, error_kind
+from ..metrics import metrics
+from ..state import CheckResult
+
+class HostRateLimiter:
+    """同じホストへのリクエストが最低間隔を空けて送られるよう待機させる（スレッドセーフ）"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.next_allowed = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        """このホストへ次のリクエストを送ってよい時刻まで待機する"""
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            scheduled = max(now, self.next_allowed.get(host, now))
+            self.next_allowed[host] = scheduled + self.min_interval
+        if scheduled > now:
+            time.sleep(scheduled - now)
+            metrics.observe("rate_limit_wait", scheduled - now)
+
+rate_limiter = HostRateLimiter(REQUEST_INTERVAL)
+
+class CircuitBreaker:
+    """ホストごとに連続した通信エラーを数え、サイトが落ちている間は取得を試みずにすぐ失敗させる（スレッドセーフ）
+
+    failure_threshold 回続けて通信エラーになったホストは reset_timeout 秒間遮断する。
+    その後は1件だけ試し、成功すれば元に戻し、失敗すればまた遮断する。
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def before_request(self, url):
+        """ホストが遮断中であれば CircuitOpenError を送出する"""
+        host = urlparse(url).netloc
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is None or state["opened_at"] is None:
+                return
+            remaining = state["opened_at"] + self.reset_timeout - time.monotonic()
+            if remaining > 0 or state["trial"]:
+                metrics.count("circuit_rejected")
+                raise CircuitOpenError(f"{host} は停止中とみなしているため取得しません（{state['failures']}回続けて通信エラー）")
+            # 遮断時間が過ぎたら1件だけ試す
+            state["trial"] = True
+
+    def record_success(self, url):
+        """ホストから応答があった（通信エラー以外の結果になった）ことを記録する"""
+        host = urlparse(url).netloc
+        with self.lock:
+            state = self.hosts.pop(host, None)
+        if state is not None and state["opened_at"] is not None:
+            print(f"{host} との通信が回復しました。")
+
+    def record_failure(self, url):
+        """ホストとの通信エラーを記録し、続けて failure_threshold 回に達したら遮断する"""
+        host = urlparse(url).netloc
+        with self.lock:
+            state = self.hosts.setdefault(host, {"failures": 0, "opened_at": None, "trial": False})
+            state["failures"] += 1
+            if state["trial"] or (state["opened_at"] is None and state["failures"] >= self.failure_threshold):
+                state["opened_at"] = time.monotonic()
+                state["trial"] = False
+                opened = True
+            else:
+                opened = False
+        if opened:
+            print(f"{host} で通信エラーが続いたため、{self.reset_timeout}秒間は取得を試みずにエラーとします。")
+            metrics.count("circuit_opened")
+
+    def open_hosts(self):
+        """遮断中のホストのリスト"""
+        with self.lock:
+            return [host for host, state in self.hosts.items() if state["opened_at"] is not None]
+
+circuit_breaker = CircuitBreaker()
+
+def fetch_with_retries(url, func, max_retries=FETCH_MAX_RETRIES, backoff=FETCH_BACKOFF):
+    """func() を呼び、再試行できるエラー（通信エラーなど）の場合はゆらぎ付きの指数バックオフで再試行する
+
+    ホストが遮断中の場合は func() を呼ばずに CircuitOpenError を送出する。
+    FetchError 以外の例外は other の FetchError として送出する。
+    """
+    for attempt in range(max_retries + 1):
+        circuit_breaker.before_request(url)
+        try:
+            result = func()
+        except Exception as e:
+            error = e if isinstance(e, FetchError) else FetchError(f"予期せぬエラーが発生しました: {e}")
+            if isinstance(error, NetworkError):
+                circuit_breaker.record_failure(url)
+            else:
+                circuit_breaker.record_success(url)
+            if not error.retryable or attempt == max_retries:
+                if error is e:
+                    raise
+                raise error from e
+            delay = backoff * (2 ** attempt) * (0.5 + random.random())
+            print(f"{error}（{delay:.1f}秒後に再試行します: {attempt + 1}/{max_retries}回目）")
+            metrics.count("fetch_retry")
+            time.sleep(delay)
+        else:
+            circuit_breaker.record_success(url)
+            return result
+
+def remember_auth_failure(login):
+    """ログインに失敗した場合、CIRCUIT_RESET_TIMEOUT 秒間はログインし直さずに AuthError を送出するデコレーター
+
+    ログイン情報が誤っている場合に、商品ごとにログインを試してアカウントがロックされないようにする。
+    """
+    @functools.wraps(login)
+    def wrapper(self, *args, **kwargs):
+        failure = getattr(self, "auth_failure", None)
+        if failure is not None and time.monotonic() - failure[0] < CIRCUIT_RESET_TIMEOUT:
+            raise AuthError(f"直前のログインに失敗したため、ログインし直しません（{failure[1]}）")
+        try:
+            return login(self, *args, **kwargs)
+        except AuthError as e:
+            self.auth_failure = (time.monotonic(), e)
+            raise
+    return wrapper
+
+def error_result(product_url, error):
+    """取得できなかった商品の (商品名, 在庫状況, 判定ルール, ProductRecord) のタプルを返す"""
+    print(error)
+    metrics.count(f"error_{error.kind}")
+    product_id = product_url.split("/")[-1]
+    return (f"商品ID: {product_id}", error.status, None, None)
+
+class BrowserPool:
+    """BrowserSessionを最大 size 個保持し、並行チェック中のスレッドに1つずつ貸し出す
+
+    BrowserSession は初めて貸し出す時点で作り、Chromeはそのセッションが初めて使われた時点で起動するため、
+    HTTP取得で足りる場合はSeleniumの読み込みもChromeの起動もしない。
+    """
+
+    def __init__(self, size, profile=BROWSER_PROFILE):
+        self.profile = profile
+        self.sessions = []
+        # まだ作っていないセッションの分は None を入れておく
+        self.available = queue.Queue()
+        for _ in range(size):
+            self.available.put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @contextmanager
+    def acquire(self):
+        """空いているBrowserSessionを借りる（使用後は自動で返却される）"""
+        session = self.available.get()
+        if session is None:
+            try:
+                from .browser import BrowserSession
+                session = BrowserSession(self.profile)
+            except BaseException:
+                self.available.put(None)
+                raise
+            self.sessions.append(session)
+        try:
+            yield session
+        finally:
+            self.available.put(session)
+
+    def close(self):
+        """すべてのChromeを終了する"""
+        for session in self.sessions:
+            session.close()
+
+def get_stock_status(product_url, backend, http_session=None, browser_pool=None, fetch_cache=None):
+    """指定されたバックエンドで在庫状況と商品名を取得する
+
+    backend が "auto" の場合はHTTPで取得し、解析できるページが得られなかった場合のみSeleniumで取得し直す。
+    通信エラー（サイトの停止を含む）の場合は、Seleniumでも同じ結果になるため取得し直さない。
+
+    Returns:
+        tuple: (商品名, 在庫状況, 判定ルール, ProductRecord) のタプル（判定ルールと ProductRecord はエラー時は None）
+    """
+    if backend in ("http", "auto"):
+        from .http import get_stock_status_with_http
+        result = get_stock_status_with_http(product_url, http_session, fetch_cache)
+        status = result[1]
+        if backend == "http" or error_kind(status) in (None, "network"):
+            return result
+        print(f"HTTPでの取得に失敗しました（{status}）。Seleniumで再取得します。")
+        metrics.count("selenium_fallback")
+
+    from .browser import get_stock_status_with_selenium
+    if browser_pool is None:
+        return get_stock_status_with_selenium(product_url)
+    with browser_pool.acquire() as browser_session:
+        return get_stock_status_with_selenium(product_url, browser_session)
+
+def iter_check_products(product_urls, backend, concurrency=CONCURRENCY, browser_profile=BROWSER_PROFILE,
+                        fetch_cache=None, http_session=None, browser_pool=None):
+    """複数の商品を並行してチェックし、チェックが終わった順に CheckResult を返すジェネレーター
+
+    同時にチェックする商品数は concurrency までに制限し、同じホストへのリクエスト間隔は
+    rate_limiter で空ける。ログインは取得方式ごとに共有し、Chromeは必要になった時点で起動する。
+    fetch_cache を指定した場合、HTTP取得で変更のないページは前回の判定結果を使う。
+    まだ受け取られていない結果は concurrency の2倍までしか保持しないため、
+    product_urls はイテレーターでもよく、商品数が増えてもチェック結果のためのメモリ使用量は増えない。
+    http_session / browser_pool を指定した場合は、そのログイン済みのセッションとChromeを使う（終了時に閉じない）。
+    """
+    concurrency = max(1, concurrency)
+    if http_session is None and backend != "selenium":
+        from .http import HttpSession
+        own_session = HttpSession()
+    else:
+        own_session = nullcontext(http_session)
+    own_pool = BrowserPool(concurrency, browser_profile) if browser_pool is None else nullcontext(browser_pool)
+    with own_session as http_session, own_pool as browser_pool:
+        def check(product_url):
+            print(f"\n商品チェック中: {product_url}")
+            with metrics.track_product(product_url) as record:
+                start = time.perf_counter()
+                product_name, status, rule, product_record = get_stock_status(
+                    product_url, backend, http_session, browser_pool, fetch_cache
+                )
+                latency = time.perf_counter() - start
+                record.update(name=product_name, status=status, rule=rule, latency=latency)
+            return CheckResult(product_url, product_name, status, rule, latency, product_record)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            for product_url in product_urls:
+                pending.add(executor.submit(check, product_url))
+                if len(pending) >= concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+
+def check_products(product_urls, backend, concurrency=CONCURRENCY, browser_profile=BROWSER_PROFILE,
+                   fetch_cache=None):
+    """複数の商品を並行してチェックする（iter_check_products の結果をまとめて返す）
+
+    Returns:
+        list: product_urls と同じ順序の CheckResult のリスト
+    """
+    results = {
+        result.url: result
+        for result in iter_check_products(product_urls, backend, concurrency, browser_profile, fetch_cache)
+    }
+    return [results[product_url] for product_url in product_urls]
@@ -0,0 +1,351 @@
+"""Selenium（Chrome）による商品ページの取得"""
+import time
+from urllib.parse import urlparse
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from ..classifier import parse_product_page
+from ..config import BROWSER_PROFILE, CI_MEDICAL_PASSWORD, CI_MEDICAL_USERNAME, LOGIN_URL, PAGE_READY_TIMEOUT, USER_AGENT
+from ..errors import AuthError, FetchError, NetworkError
+from ..metrics import metrics
+from . import error_result, fetch_with_retries, rate_limiter, remember_auth_failure
+from .cookies import cookie_store
+
+# 商品ページの読み込み完了とみなす要素（在庫状況表示または買い物カゴボタン）
+PAGE_READY_SELECTOR = "span.product-stock__status, a.button-cart"
+
+# ポップアップの閉じるボタン（1回の検索でまとめて探す）
+POPUP_CLOSE_XPATH = (
+    "//button[contains(text(), 'ウィンドウを閉じる') or contains(text(), '閉じる') or contains(text(), 'Close')]"
+    " | //*[contains(concat(' ', normalize-space(@class), ' '), ' modal-close ')]"
+    " | //*[contains(concat(' ', normalize-space(@class), ' '), ' popup-close ')]"
+)
+
+# leanプロファイルで読み込みを遮断するURLパターン（CDP Network.setBlockedURLs の形式）
+LEAN_BLOCKED_URLS = [
+    # 画像・動画・フォント
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.mp4", "*.webm", "*.mp3",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    # 解析・広告
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*googleadservices.com*", "*connect.facebook.net*",
+    "*facebook.com/tr*", "*hotjar.com*", "*clarity.ms*", "*criteo.com*",
+]
+
+# ページ読み込みで転送されたバイト数（Resource Timing APIから集計）
+TRANSFER_SIZE_SCRIPT = """
+const nav = performance.getEntriesByType('navigation')[0];
+let total = nav ? nav.transferSize : 0;
+for (const entry of performance.getEntriesByType('resource')) {
+    total += entry.transferSize;
+}
+return total;
+"""
+
+def build_chrome_options(profile=BROWSER_PROFILE):
+    """ヘッドレスChromeの起動オプションを作成する
+
+    profile が "lean" の場合は画像を読み込まず、DOMが構築された時点で driver.get から戻る（eager）。
+    """
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--ignore-certificate-errors")
+    options.add_argument("--allow-running-insecure-content")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option('useAutomationExtension', False)
+
+    options.add_argument(f"user-agent={USER_AGENT}")
+
+    if profile == "lean":
+        options.page_load_strategy = "eager"
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+        })
+    return options
+
+class BrowserSession:
+    """ログイン済みのChromeを1つ保持し、全商品のチェックで使い回す
+
+    Chromeの起動とログインは最初の商品ページ取得時に一度だけ行う。
+    セッションが切れてログインページへリダイレクトされた場合のみ再ログインする。
+    """
+
+    def __init__(self, profile=BROWSER_PROFILE):
+        self.profile = profile
+        self.driver = None
+        self.logged_in = False
+        self.login_count = 0
+        self.cookies_tried = False
+        # 直近の商品ページ取得の各段階の所要時間（秒）と転送バイト数
+        self.last_timings = {}
+        self.last_transfer_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """Chromeを起動する（起動済みの場合は何もしない）"""
+        if self.driver:
+            return self.driver
+
+        print(f"Chromeを起動中... (プロファイル: {self.profile})")
+        with metrics.phase("browser_start"):
+            self.driver = webdriver.Chrome(options=build_chrome_options(self.profile))
+            self.driver.set_page_load_timeout(60)
+            # 暗黙の待機は要素がない場合に毎回待たされるため使わず、明示的な待機だけを使う
+            self.driver.implicitly_wait(0)
+
+            # WebDriver検出を回避
+            self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+            # 在庫判定に不要なリソースの読み込みを遮断
+            if self.profile == "lean":
+                self.driver.execute_cdp_cmd("Network.enable", {})
+                self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+
+        self.logged_in = False
+        return self.driver
+
+    def close(self):
+        """Chromeを終了する"""
+        if self.driver:
+            try:
+                self.driver.quit()
+            except:
+                pass
+        self.driver = None
+        self.logged_in = False
+
+    @remember_auth_failure
+    @metrics.timed("login_browser")
+    def login(self):
+        """CI Medicalにログインする"""
+        driver = self.start()
+
+        print(f"ログインページにアクセス中: {LOGIN_URL}")
+        rate_limiter.wait(LOGIN_URL)
+        driver.get(LOGIN_URL)
+
+        # HTMLソースから確認した正確なセレクタを使用
+        try:
+            login_id_field = WebDriverWait(driver, 30).until(
+                EC.presence_of_element_located((By.ID, "account_login"))
+            )
+            print("ログインIDフィールドが見つかりました")
+        except TimeoutException:
+            print("ログインIDフィールドが見つかりません")
+            raise AuthError("ログインフォームが見つかりません")
+
+        # パスワードフィールド
+        try:
+            password_field = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.ID, "account_password"))
+            )
+            print("パスワードフィールドが見つかりました")
+        except TimeoutException:
+            raise AuthError("パスワードフィールドが見つかりません")
+
+        # ログイン処理
+        print("ログイン情報を入力中...")
+        login_id_field.clear()
+        login_id_field.send_keys(CI_MEDICAL_USERNAME)
+
+        password_field.clear()
+        password_field.send_keys(CI_MEDICAL_PASSWORD)
+
+        # ログインボタン（HTMLソースから確認）
+        try:
+            submit_button = WebDriverWait(driver, 10).until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, 'input[type="submit"][value="ログイン"]'))
+            )
+            submit_button.click()
+            print("ログインボタンをクリックしました")
+        except TimeoutException:
+            raise AuthError("ログインボタンが見つかりません")
+
+        # ログインページから遷移するまで待機
+        try:
+            WebDriverWait(driver, 30).until(lambda d: not self.is_session_expired())
+        except TimeoutException:
+            raise AuthError("ログインに失敗しました（ログインページから遷移しませんでした）")
+
+        self.logged_in = True
+        self.login_count += 1
+        try:
+            cookie_store.save(cookie_store.from_selenium(driver))
+        except Exception as e:
+            print(f"セッションを保存できませんでした: {e}")
+
+    def restore_session(self):
+        """保存したCookieをChromeに復元する（最初の1回だけ試す）
+
+        有効かどうかは最初の商品ページで確かめ、ログインページへリダイレクトされた場合は
+        fetch_page_source がログインし直す。
+
+        Returns:
+            bool: Cookieを復元した場合 True
+        """
+        if self.cookies_tried:
+            return False
+        self.cookies_tried = True
+        cookies = cookie_store.load()
+        if not cookies:
+            return False
+        driver = self.start()
+        try:
+            cookie_store.to_selenium(cookies, driver)
+        except WebDriverException as e:
+            print(f"保存したセッションを復元できませんでした: {e}")
+            return False
+        print("保存したセッションを復元しました。ログインを省略します。")
+        metrics.count("session_restored")
+        self.logged_in = True
+        return True
+
+    def is_session_expired(self):
+        """現在のページがログインページであれば、セッション切れと判断する"""
+        login_path = urlparse(LOGIN_URL).path
+        return urlparse(self.driver.current_url).path == login_path
+
+    def ensure_logged_in(self):
+        """未ログインの場合のみログインする（保存したセッションがあれば、先にそれを復元する）"""
+        if not self.driver or not self.logged_in:
+            if self.restore_session():
+                return
+            self.login()
+
+    def wait_until_ready(self):
+        """在庫状況表示または買い物カゴボタンが現れるまで待機する
+
+        どちらも現れないページ（価格表示のみなど）は、タイムアウト後にそのまま判定へ進む。
+        """
+        try:
+            WebDriverWait(self.driver, PAGE_READY_TIMEOUT).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, PAGE_READY_SELECTOR))
+            )
+        except TimeoutException:
+            print(f"在庫表示要素が{PAGE_READY_TIMEOUT}秒以内に見つかりませんでした。現在のページで判定します。")
+
+    def close_popup(self):
+        """ポップアップが表示されていれば閉じる（閉じるボタンは1回の検索でまとめて探す）"""
+        try:
+            buttons = self.driver.find_elements(By.XPATH, POPUP_CLOSE_XPATH)
+            close_button = next((b for b in buttons if b.is_displayed() and b.is_enabled()), None)
+            if close_button is None:
+                print("ポップアップは表示されませんでした。")
+                return
+
+            close_button.click()
+            metrics.count("popup_closed")
+            try:
+                WebDriverWait(self.driver, 2).until(EC.invisibility_of_element(close_button))
+            except TimeoutException:
+                pass
+            print("ポップアップを閉じました。")
+        except WebDriverException as e:
+            print(f"ポップアップを閉じられませんでした: {e}")
+
+    def fetch_page_source(self, product_url):
+        """ログイン済みのChromeで商品ページを開き、HTMLソースを返す
+
+        各段階（ページ遷移、在庫表示待ち、ポップアップ処理）の所要時間は last_timings に記録する。
+        """
+        self.ensure_logged_in()
+        driver = self.driver
+        timings = {}
+
+        print(f"商品ページにアクセス中: {product_url}")
+        rate_limiter.wait(product_url)
+        start = time.perf_counter()
+        driver.get(product_url)
+
+        # セッションが切れていた場合は再ログインして開き直す
+        if self.is_session_expired():
+            print("セッションが切れています。再ログインします。")
+            metrics.count("relogin")
+            self.logged_in = False
+            self.login()
+            rate_limiter.wait(product_url)
+            driver.get(product_url)
+        timings["navigate"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.wait_until_ready()
+        timings["ready"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.close_popup()
+        timings["popup"] = time.perf_counter() - start
+
+        self.last_timings = timings
+        for name, seconds in timings.items():
+            metrics.observe(f"page_{name}", seconds)
+        try:
+            self.last_transfer_bytes = int(driver.execute_script(TRANSFER_SIZE_SCRIPT) or 0)
+        except WebDriverException:
+            self.last_transfer_bytes = 0
+        print(
+            f"ページ読み込み時間: 遷移 {timings['navigate']:.2f}秒 / "
+            f"在庫表示待ち {timings['ready']:.2f}秒 / ポップアップ {timings['popup']:.2f}秒 "
+            f"(転送量: {self.last_transfer_bytes / 1024:.0f}KB)"
+        )
+        return driver.page_source
+
+def check_with_selenium(product_url, session):
+    """ログイン済みのChromeで商品ページを開き、(商品名, 在庫状況, 判定ルール, ProductRecord) のタプルを返す
+
+    取得できなかった場合は原因に応じた FetchError を送出する。
+    """
+    try:
+        page_source = session.fetch_page_source(product_url)
+    except TimeoutException as e:
+        raise NetworkError(f"要素のロード中にタイムアウトしました: {e}", "タイムアウト") from e
+    except WebDriverException as e:
+        # ブラウザが落ちている可能性があるため、Chromeを起動し直して再試行する
+        session.close()
+        if "net::ERR_" in str(e):
+            raise NetworkError(f"ページを読み込めませんでした: {e}") from e
+        raise FetchError(f"WebDriverエラーが発生しました: {e}", "WebDriver", retryable=True) from e
+
+    # ページソースを解析して商品名と在庫状況を判定
+    result = parse_product_page(page_source, product_url)
+    return (result.name, result.status, result.rule, result.record)
+
+def get_stock_status_with_selenium(product_url, session=None):
+    """Seleniumを使用してウェブページから在庫状況と商品名を取得する
+
+    通信エラーやブラウザの異常は fetch_with_retries で再試行する。
+
+    Args:
+        product_url: 商品URL
+        session: ログイン済みのBrowserSession（省略時はこの商品のためだけにChromeを起動してログインする）
+
+    Returns:
+        tuple: (商品名, 在庫状況, 判定ルール, ProductRecord) のタプル（判定ルールと ProductRecord はエラー時は None）
+    """
+    own_session = session is None
+    if own_session:
+        session = BrowserSession()
+
+    try:
+        return fetch_with_retries(product_url, lambda: check_with_selenium(product_url, session))
+    except FetchError as e:
+        return error_result(product_url, e)
+    finally:
+        if own_session:
+            session.close()
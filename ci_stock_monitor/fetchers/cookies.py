@@ -0,0 +1,127 @@
+"""ログイン済みセッションのCookieの保存と復元"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+from ..config import COOKIE_JAR_FILE, COOKIE_JAR_KEY
+
+class CookieJarStore:
+    """ログイン済みセッションのCookieを実行をまたいで保存し、requests と Selenium に復元する
+
+    ファイルは所有者だけが読み書きできる権限（0600）で作る。COOKIE_JAR_KEY を指定した場合は
+    cryptography の Fernet で暗号化する（Actionsのキャッシュに保存する場合は必ず指定する）。
+    Cookieは name, value, domain, path, secure, httpOnly, expires の辞書のリストで扱う。
+    """
+
+    def __init__(self, path=COOKIE_JAR_FILE, key=COOKIE_JAR_KEY):
+        self.path = path
+        self.key = key
+        self.lock = threading.Lock()
+
+    def _fernet(self):
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            raise RuntimeError("COOKIE_JAR_KEY を使うには cryptography が必要です（pip install cryptography）")
+        # 任意の文字列のキーから、Fernetの32バイトのキーを作る
+        return Fernet(base64.urlsafe_b64encode(hashlib.sha256(self.key.encode("utf-8")).digest()))
+
+    def load(self, now=None):
+        """保存したCookieのうち、期限が切れていないものを返す（読めない場合は空のリスト）"""
+        now = time.time() if now is None else now
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with self.lock, open(self.path, "rb") as f:
+                data = f.read()
+            if self.key:
+                data = self._fernet().decrypt(data)
+            cookies = json.loads(data.decode("utf-8"))
+        except Exception as e:
+            print(f"保存したセッションを読み込めませんでした: {e}")
+            return []
+        return [cookie for cookie in cookies if not cookie.get("expires") or cookie["expires"] > now]
+
+    def save(self, cookies):
+        """Cookieを保存する（所有者だけが読み書きできる権限で、一時ファイルから置き換える）"""
+        if not self.path or not cookies:
+            return
+        data = json.dumps(cookies, ensure_ascii=False).encode("utf-8")
+        if self.key:
+            data = self._fernet().encrypt(data)
+        tmp_path = f"{self.path}.tmp"
+        with self.lock:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def from_requests(cookie_jar):
+        return [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "secure": cookie.secure,
+                "httpOnly": cookie.has_nonstandard_attr("HttpOnly"),
+                "expires": cookie.expires,
+            }
+            for cookie in cookie_jar
+        ]
+
+    @staticmethod
+    def to_requests(cookies, session):
+        for cookie in cookies:
+            session.cookies.set(
+                cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"],
+                secure=cookie["secure"], expires=cookie.get("expires"),
+                rest={"HttpOnly": None} if cookie.get("httpOnly") else {},
+            )
+
+    @staticmethod
+    def from_selenium(driver):
+        # get_cookies() は現在のドメインのCookieしか返さないため、CDPで全Cookieを取得する
+        cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        return [
+            {
+                "name": cookie["name"],
+                "value": cookie["value"],
+                "domain": cookie["domain"],
+                "path": cookie["path"],
+                "secure": cookie["secure"],
+                "httpOnly": cookie["httpOnly"],
+                "expires": None if cookie.get("session") or cookie.get("expires", -1) < 0 else cookie["expires"],
+            }
+            for cookie in cookies
+        ]
+
+    @staticmethod
+    def to_selenium(cookies, driver):
+        # CDPで設定すると、Cookieのドメインのページを先に開かなくてよい
+        params = []
+        for cookie in cookies:
+            param = {
+                "name": cookie["name"],
+                "value": cookie["value"],
+                "path": cookie["path"],
+                "secure": cookie["secure"],
+                "httpOnly": cookie.get("httpOnly", False),
+            }
+            if cookie["domain"].startswith("."):
+                param["domain"] = cookie["domain"]
+            else:
+                # ホスト限定のCookieはURLで指定する
+                scheme = "https" if cookie["secure"] else "http"
+                param["url"] = f"{scheme}://{cookie['domain']}{cookie['path']}"
+            if cookie.get("expires"):
+                param["expires"] = cookie["expires"]
+            params.append(param)
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": params})
+
+cookie_store = CookieJarStore()
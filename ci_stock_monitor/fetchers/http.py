@@ -0,0 +1,440 @@
+"""requestsによる商品ページの取得（ログイン、条件付き取得、一覧ページの展開）"""
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+from urllib.parse import urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from ..classifier import OUT_OF_STOCK_INDICATORS, parse_listing_page, parse_product_page, stock_classifier
+from ..config import (
+    AUTH_PROBE_URL, CI_MEDICAL_PASSWORD, CI_MEDICAL_USERNAME, FETCH_CACHE_FILE, HTML_PARSER, HTTP_POOL_SIZE,
+    HTTP_TIMEOUT, LISTING_MAX_PAGES, LOGIN_URL, USER_AGENT,
+)
+from ..errors import AuthError, FetchError, NetworkError, ParseError
+from ..metrics import metrics
+from ..records import ProductRecord
+from ..state import write_json_atomic
+from . import error_result, fetch_with_retries, rate_limiter, remember_auth_failure
+from .cookies import cookie_store
+
+# 在庫判定に関係しない部分（スクリプト、スタイル、コメント、毎回変わるCSRFトークン）
+VOLATILE_HTML_PATTERN = re.compile(
+    r"<script\b.*?</script>|<style\b.*?</style>|<noscript\b.*?</noscript>|<!--.*?-->"
+    r"|<meta[^>]+csrf-token[^>]*>|<input[^>]+authenticity_token[^>]*>",
+    re.S | re.I,
+)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def classified_start_pattern(watched):
+    """StockClassifier が判定に使う要素（(タグ, クラス) ごと）の開始タグと og:title を探す正規表現を作る"""
+    parts = [r"<meta\b[^>]*og:title[^>]*>"]
+    for tag, class_names in sorted(watched.items()):
+        if None in class_names:
+            parts.append(rf"<{tag}\b[^>]*>")
+            continue
+        classes = "|".join(re.escape(class_name) for class_name in sorted(class_names))
+        parts.append(rf"<{tag}\b[^>]*\bclass\s*=\s*[\"'][^\"']*(?<![\w-])(?:{classes})(?![\w-])[^>]*>")
+    return re.compile("|".join(parts), re.I)
+
+# 商品名、在庫状況表示、価格、買い物カゴボタン、購入フォーム、納期、規格の一覧などの開始タグ
+CLASSIFIED_START_PATTERN = classified_start_pattern(stock_classifier.watched)
+TAG_NAME_PATTERN = re.compile(r"<([\w-]+)")
+
+@functools.lru_cache(maxsize=None)
+def tag_pattern(tag):
+    """tag の開始タグ・終了タグを探す正規表現（終了タグの場合は group(1) が "/"）"""
+    return re.compile(rf"<(/?){tag}\b[^>]*>", re.I)
+
+def element_end(page_source, tag, start):
+    """開始タグの直後（start）から同じタグの入れ子を数え、対応する終了タグの直後の位置を返す
+
+    終了タグが見つからない場合は、判定に使う部分を取りこぼさないようページの最後までとする。
+    """
+    depth = 1
+    for match in tag_pattern(tag).finditer(page_source, start):
+        if match.group(1):
+            depth -= 1
+            if depth == 0:
+                return match.end()
+        elif not match.group(0).endswith("/>"):
+            depth += 1
+    return len(page_source)
+
+def classified_fragments(page_source):
+    """判定に使う要素を、入れ子になった子要素も含めてページの順に取り出す
+
+    取り出した要素の中にある別の判定に使う要素は、外側の要素に含まれるため重ねて取り出さない。
+    """
+    fragments = []
+    position = 0
+    while True:
+        match = CLASSIFIED_START_PATTERN.search(page_source, position)
+        if match is None:
+            return fragments
+        tag = TAG_NAME_PATTERN.match(match.group(0)).group(1).lower()
+        end = match.end() if tag == "meta" else element_end(page_source, tag, match.end())
+        fragments.append(page_source[match.start():end])
+        position = end
+
+def page_fingerprint(page_source):
+    """在庫判定に使う部分（商品名、在庫表示、価格、買い物カゴボタンなど）だけのハッシュを返す
+
+    おすすめ商品やランキングなど、毎回入れ替わる部分が変わってもハッシュは変わらない。
+    ページ全体のテキストから判定するルールのため、在庫なしを示すテキストが含まれるかも加える。
+    HTMLを解析せずに正規表現とタグの入れ子の数え上げだけで計算するため、解析+判定よりもはるかに軽い。
+    """
+    page_source = VOLATILE_HTML_PATTERN.sub("", page_source)
+    fragments = classified_fragments(page_source)
+    fragments += [indicator for indicator in OUT_OF_STOCK_INDICATORS if indicator in page_source]
+    normalized = WHITESPACE_PATTERN.sub(" ", "\n".join(fragments))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+class FetchCache:
+    """商品ページごとのETag/Last-Modified、ページのハッシュ、前回の判定結果を保存する
+
+    条件付きリクエストで304が返った場合や、ページのハッシュが前回と同じ場合は、
+    解析と判定を省略して前回の結果を使う。
+    """
+
+    def __init__(self, path=FETCH_CACHE_FILE):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except:
+                self.entries = {}
+
+    def conditional_headers(self, url):
+        """前回のレスポンスに基づく条件付きリクエストのヘッダーを返す"""
+        entry = self.entries.get(url)
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def lookup(self, url, fingerprint=None):
+        """前回の判定結果を返す（fingerprint が指定された場合は一致するときのみ）
+
+        Returns:
+            tuple: (商品名, 在庫状況, 判定ルール, ProductRecord) のタプル。使えるキャッシュがない場合は None
+        """
+        entry = self.entries.get(url)
+        if not entry or (fingerprint is not None and entry.get("fingerprint") != fingerprint):
+            return None
+        with self.lock:
+            self.hits += 1
+        return (entry["name"], entry["status"], entry.get("rule"), ProductRecord.from_dict(entry.get("record")))
+
+    def refresh_validators(self, url, response):
+        """ページは前回と同じでも、新しいETag/Last-Modifiedを記録して次回の条件付きリクエストに使う"""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                entry["etag"] = response.headers.get("ETag")
+                entry["last_modified"] = response.headers.get("Last-Modified")
+
+    def store(self, url, response, fingerprint, product_name, status, rule, record=None):
+        """レスポンスの検証用ヘッダーと判定結果を記録する"""
+        with self.lock:
+            self.misses += 1
+            self.entries[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fingerprint": fingerprint,
+                "name": product_name,
+                "status": status,
+                "rule": rule,
+                "record": record.to_dict() if record is not None else None,
+            }
+
+    def save(self):
+        """キャッシュをファイルに保存する"""
+        with self.lock:
+            write_json_atomic(self.path, self.entries)
+
+class HttpSession:
+    """requests.Sessionを使い、ブラウザを起動せずにログインして商品ページを取得する
+
+    ログインページのフォームからRailsのCSRFトークン（authenticity_token）を読み取り、
+    ログイン情報と一緒にPOSTする。以降はセッションCookieで商品ページを直接GETする。
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.logged_in = False
+        self.login_count = 0
+        self.login_lock = threading.Lock()
+        self.cookies_tried = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """コネクションプールを解放する"""
+        self.session.close()
+        self.logged_in = False
+
+    def is_login_page(self, response):
+        """レスポンスがログインページであれば、未ログインと判断する"""
+        return urlparse(response.url).path == urlparse(LOGIN_URL).path
+
+    @remember_auth_failure
+    @metrics.timed("login_http")
+    def login(self):
+        """CSRFトークン付きのフォームPOSTでCI Medicalにログインする"""
+        print(f"ログインページにアクセス中 (HTTP): {LOGIN_URL}")
+        rate_limiter.wait(LOGIN_URL)
+        response = self.session.get(LOGIN_URL, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+
+        soup = BeautifulSoup(response.text, HTML_PARSER)
+        login_id_field = soup.find("input", id="account_login")
+        password_field = soup.find("input", id="account_password")
+        if not login_id_field or not password_field:
+            raise AuthError("ログインフォームが見つかりません")
+
+        form = login_id_field.find_parent("form")
+        if not form:
+            raise AuthError("ログインフォームが見つかりません")
+
+        # hiddenフィールド（authenticity_tokenなど）をそのまま送信する
+        form_data = {}
+        for hidden in form.find_all("input", type="hidden"):
+            if hidden.get("name"):
+                form_data[hidden["name"]] = hidden.get("value", "")
+
+        if "authenticity_token" not in form_data:
+            csrf_meta = soup.find("meta", {"name": "csrf-token"})
+            if csrf_meta and csrf_meta.get("content"):
+                form_data["authenticity_token"] = csrf_meta["content"]
+
+        form_data[login_id_field.get("name", "account[login]")] = CI_MEDICAL_USERNAME
+        form_data[password_field.get("name", "account[password]")] = CI_MEDICAL_PASSWORD
+
+        submit_button = form.find("input", type="submit")
+        if submit_button and submit_button.get("name"):
+            form_data[submit_button["name"]] = submit_button.get("value", "")
+
+        action_url = urljoin(response.url, form.get("action") or LOGIN_URL)
+        response = self.session.post(action_url, data=form_data, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+
+        if self.is_login_page(response):
+            raise AuthError("ログインに失敗しました（ログインページに戻されました）")
+
+        print("ログインしました (HTTP)")
+        self.logged_in = True
+        self.login_count += 1
+        try:
+            cookie_store.save(cookie_store.from_requests(self.session.cookies))
+        except Exception as e:
+            print(f"セッションを保存できませんでした: {e}")
+
+    def probe(self):
+        """ログイン済みかどうかを、リダイレクトを追わない1回のGETで確かめる
+
+        AUTH_PROBE_URL がログインページの場合は、ログイン済みなら別のページへリダイレクトされる。
+        ログインが必要なページの場合は、未ログインならログインページへリダイレクトされる。
+        """
+        rate_limiter.wait(AUTH_PROBE_URL)
+        with metrics.phase("auth_probe"):
+            response = self.session.get(AUTH_PROBE_URL, allow_redirects=False, timeout=HTTP_TIMEOUT)
+        login_path = urlparse(LOGIN_URL).path
+        if response.is_redirect:
+            return urlparse(urljoin(AUTH_PROBE_URL, response.headers["Location"])).path != login_path
+        return response.ok and urlparse(AUTH_PROBE_URL).path != login_path
+
+    def restore_session(self):
+        """保存したCookieを復元し、まだ有効であればログインを省略する（最初の1回だけ試す）
+
+        Returns:
+            bool: 保存したセッションでログイン状態になった場合 True
+        """
+        if self.cookies_tried:
+            return False
+        self.cookies_tried = True
+        cookies = cookie_store.load()
+        if not cookies:
+            return False
+        cookie_store.to_requests(cookies, self.session)
+        try:
+            valid = self.probe()
+        except requests.RequestException as e:
+            print(f"保存したセッションを確認できませんでした: {e}")
+            valid = False
+        if not valid:
+            print("保存したセッションは期限切れです。ログインし直します。")
+            self.session.cookies.clear()
+            return False
+        print("保存したセッションを復元しました (HTTP)。ログインを省略します。")
+        metrics.count("session_restored")
+        self.logged_in = True
+        return True
+
+    def ensure_logged_in(self, stale_login_count=None):
+        """未ログイン、またはstale_login_count回目のログインが切れている場合のみログインする
+
+        最初のログインの前に、保存したセッションが有効であればそれを使う。
+        複数スレッドが同時にセッション切れを検出しても、再ログインは1回だけ行う。
+        """
+        with self.login_lock:
+            if self.logged_in and self.login_count != stale_login_count:
+                return
+            if stale_login_count is None and self.restore_session():
+                return
+            self.logged_in = False
+            self.login()
+
+    def fetch(self, product_url, headers=None):
+        """ログイン済みのセッションで商品ページをGETし、レスポンスを返す
+
+        条件付きリクエストのヘッダーを渡した場合、変更がなければ304のレスポンスが返る。
+        """
+        self.ensure_logged_in()
+        login_count = self.login_count
+
+        print(f"商品ページにアクセス中 (HTTP): {product_url}")
+        rate_limiter.wait(product_url)
+        with metrics.phase("http_fetch"):
+            response = self.session.get(product_url, headers=headers, timeout=HTTP_TIMEOUT)
+
+        # セッションが切れていた場合は再ログインして取得し直す
+        if self.is_login_page(response):
+            print("セッションが切れています。再ログインします。")
+            metrics.count("relogin")
+            self.ensure_logged_in(stale_login_count=login_count)
+            rate_limiter.wait(product_url)
+            with metrics.phase("http_fetch"):
+                response = self.session.get(product_url, headers=headers, timeout=HTTP_TIMEOUT)
+
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def fetch_page_source(self, product_url):
+        """ログイン済みのセッションで商品ページをGETし、HTMLソースを返す"""
+        return self.fetch(product_url).text
+
+def check_with_http(product_url, session, fetch_cache=None):
+    """ログイン済みのセッションで商品ページをGETし、(商品名, 在庫状況, 判定ルール, ProductRecord) のタプルを返す
+
+    fetch_cache を指定した場合は条件付きリクエストを送り、ページが前回から変わっていなければ
+    解析と判定を省略して前回の結果を返す。取得できなかった場合は原因に応じた FetchError を送出する。
+    """
+    try:
+        if fetch_cache is None:
+            page_source = session.fetch_page_source(product_url)
+        else:
+            response = session.fetch(product_url, fetch_cache.conditional_headers(product_url))
+            cached = None
+            if response.status_code == 304:
+                cached = fetch_cache.lookup(product_url)
+            else:
+                page_source = response.text
+                with metrics.phase("fingerprint"):
+                    fingerprint = page_fingerprint(page_source)
+                cached = fetch_cache.lookup(product_url, fingerprint)
+                if cached:
+                    # サーバーが検証用ヘッダーを変えた場合に、次回から304を受け取れるようにする
+                    fetch_cache.refresh_validators(product_url, response)
+            if cached:
+                print(f"ページに変更がないため、前回の判定結果を使います: {cached[0]} / {cached[1]}")
+                return cached
+            if response.status_code == 304:
+                # キャッシュが失われている場合は条件なしで取得し直す
+                response = session.fetch(product_url)
+                page_source = response.text
+                fingerprint = page_fingerprint(page_source)
+
+        result = parse_product_page(page_source, product_url)
+
+        if not result.is_product_page:
+            raise ParseError("商品ページの在庫表示要素が見つかりませんでした。")
+
+        if fetch_cache is not None:
+            fetch_cache.store(
+                product_url, response, fingerprint, result.name, result.status, result.rule, result.record
+            )
+        return (result.name, result.status, result.rule, result.record)
+
+    except requests.Timeout as e:
+        raise NetworkError(f"HTTPリクエストがタイムアウトしました: {e}", "タイムアウト") from e
+    except requests.HTTPError as e:
+        status_code = e.response.status_code if e.response is not None else None
+        if status_code is None or status_code == 429 or status_code >= 500:
+            raise NetworkError(f"HTTPエラーが発生しました: {e}", "サーバー") from e
+        raise FetchError(f"HTTPエラーが発生しました: {e}", f"HTTP {status_code}") from e
+    except requests.RequestException as e:
+        raise NetworkError(f"HTTP通信エラーが発生しました: {e}") from e
+
+def get_stock_status_with_http(product_url, session=None, fetch_cache=None):
+    """requestsを使用してウェブページから在庫状況と商品名を取得する
+
+    取得したページに在庫判定用の要素がない場合は "エラー: 解析不可" を返す。
+    通信エラー、タイムアウト、5xx/429は fetch_with_retries で再試行する。
+
+    Args:
+        product_url: 商品URL
+        session: ログイン済みのHttpSession（省略時はこの商品のためだけにログインする）
+        fetch_cache: FetchCache（省略時はキャッシュを使わない）
+
+    Returns:
+        tuple: (商品名, 在庫状況, 判定ルール, ProductRecord) のタプル（判定ルールと ProductRecord はエラー時は None）
+    """
+    own_session = session is None
+    if own_session:
+        session = HttpSession()
+
+    try:
+        return fetch_with_retries(product_url, lambda: check_with_http(product_url, session, fetch_cache))
+    except FetchError as e:
+        return error_result(product_url, e)
+    finally:
+        if own_session:
+            session.close()
+
+def expand_listing(listing_url, session, max_pages=LISTING_MAX_PAGES):
+    """カテゴリー/検索結果ページを（ページ送りをたどって）商品に展開する
+
+    Returns:
+        list: [(商品URL, 商品名, 在庫状況, 判定ルール), ...]（一覧で判定できなかった商品は在庫状況が None）
+    """
+    products = {}
+    page_url = listing_url
+    for _ in range(max_pages):
+        with metrics.phase("listing_fetch"):
+            page_source = session.fetch_page_source(page_url)
+        page_products, next_url = parse_listing_page(page_source, page_url)
+        for product in page_products:
+            products.setdefault(product[0], product)
+        if not next_url or next_url == page_url:
+            break
+        page_url = next_url
+
+    resolved = sum(1 for product in products.values() if product[2] is not None)
+    print(f"一覧ページを展開しました: {listing_url}（{len(products)}件、うち{resolved}件は一覧で在庫状況を判定）")
+    metrics.count("listing_products", len(products))
+    metrics.count("listing_resolved", resolved)
+    return list(products.values())
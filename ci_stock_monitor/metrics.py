@@ -0,0 +1,258 @@
+"""実行中の段階ごとの所要時間と件数の記録（実行レポート、Prometheusのテキスト形式）"""
+import functools
+import heapq
+import json
+import math
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from .config import METRICS_PRODUCT_LATENCY, PHASE_SAMPLES, REPORT_PRODUCTS
+from .errors import error_kind
+
+def percentile(values, q):
+    """値のリストの q 分位点（0〜1、最近傍順位法）を返す（空の場合は 0.0）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+def prometheus_labels(**labels):
+    """Prometheusのテキスト形式のラベル部分（{name="value",...}）を作る"""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+class RunMetrics:
+    """1回の実行中の段階ごとの所要時間と、各種の件数を記録する（スレッドセーフ）
+
+    段階（Chrome起動、ログイン、ページ読み込み、解析、判定、保存、通知など）の所要時間は
+    phase() / timed() / observe() で記録し、件数は count() で数える。
+    track_product() の中で記録した所要時間は、商品ごとの記録にも加える。
+
+    商品数が増えてもメモリ使用量が増えないよう、段階ごとの所要時間は回数・合計・最大と
+    p50/p95 用の最大 PHASE_SAMPLES 件の標本だけを、商品ごとの記録は在庫状況・判定ルールごとの
+    件数と所要時間の長かった product_limit 件だけを保持する。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.random = random.Random()
+        self.reset()
+
+    def reset(self, product_limit=REPORT_PRODUCTS):
+        """記録を消去して、新しい実行の計測を始める
+
+        product_limit は実行レポートに含める商品ごとの記録の件数（None の場合はすべて）。
+        """
+        with self.lock:
+            self.started_at = datetime.now()
+            self.start = time.perf_counter()
+            self.phases = {}
+            self.counters = {}
+            self.product_limit = product_limit
+            self.products = []
+            self.products_seen = 0
+            self.statuses = {}
+            self.rules = {}
+            self.errors = {}
+
+    @contextmanager
+    def phase(self, name):
+        """with ブロックの所要時間を name の段階として記録する"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """関数の所要時間を name の段階として記録するデコレーター"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.phase(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, name, seconds):
+        """name の段階の所要時間（秒）を1件記録する"""
+        with self.lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = {"count": 0, "total": 0.0, "max": 0.0, "samples": []}
+            phase["count"] += 1
+            phase["total"] += seconds
+            phase["max"] = max(phase["max"], seconds)
+            # 標本が PHASE_SAMPLES 件を超えたら、すべての記録から同じ確率で残す（reservoir sampling）
+            samples = phase["samples"]
+            if len(samples) < PHASE_SAMPLES:
+                samples.append(seconds)
+            else:
+                i = self.random.randrange(phase["count"])
+                if i < PHASE_SAMPLES:
+                    samples[i] = seconds
+        record = getattr(self.local, "product", None)
+        if record is not None:
+            record["timings"][name] = record["timings"].get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        """name の件数を n 増やす"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def track_product(self, url):
+        """このスレッドで記録した所要時間を、商品ごとの記録（url, timings）にも加える
+
+        記録は在庫状況・判定ルール・エラー分類ごとの件数に加え、所要時間（latency）の
+        長いものから product_limit 件だけを残す。
+        """
+        record = {"url": url, "timings": {}}
+        self.local.product = record
+        try:
+            yield record
+        finally:
+            self.local.product = None
+            with self.lock:
+                self.add_product(record)
+
+    def add_product(self, record):
+        if "status" in record:
+            status = record["status"]
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            rule = record.get("rule") or "error"
+            self.rules[rule] = self.rules.get(rule, 0) + 1
+            kind = error_kind(status)
+            if kind:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+        self.products_seen += 1
+        entry = (record.get("latency", 0.0), self.products_seen, record)
+        if self.product_limit is None or len(self.products) < self.product_limit:
+            heapq.heappush(self.products, entry)
+        elif self.product_limit and entry > self.products[0]:
+            heapq.heapreplace(self.products, entry)
+
+    def phase_summary(self):
+        """段階ごとの回数、合計、平均、p50、p95、最大（秒）を返す"""
+        with self.lock:
+            phases = {name: dict(phase, samples=list(phase["samples"])) for name, phase in self.phases.items()}
+        return {
+            name: {
+                "count": phase["count"],
+                "total": phase["total"],
+                "mean": phase["total"] / phase["count"],
+                "p50": percentile(phase["samples"], 0.5),
+                "p95": percentile(phase["samples"], 0.95),
+                "max": phase["max"],
+            }
+            for name, phase in phases.items()
+        }
+
+    def report(self, **extra):
+        """実行レポート（JSONに変換できる辞書）を作る。extra はそのまま追加する
+
+        products には所要時間の長い順に商品ごとの記録を含める（reset の product_limit 件まで）。
+        """
+        with self.lock:
+            products = [
+                dict(record, timings=dict(record["timings"]))
+                for _, _, record in sorted(self.products, key=lambda entry: entry[:2], reverse=True)
+            ]
+            counters = dict(self.counters)
+            statuses = dict(self.statuses)
+            rules = dict(self.rules)
+            errors = dict(self.errors)
+        report = {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration": time.perf_counter() - self.start,
+            "phases": self.phase_summary(),
+            "counters": counters,
+            "statuses": statuses,
+            "rules": rules,
+            "errors": errors,
+            "products": products,
+        }
+        report.update(extra)
+        return report
+
+    def write_report(self, path, report):
+        """実行レポートをJSONで保存する"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    def prometheus_text(self, report):
+        """実行レポートをPrometheusのテキスト形式にする
+
+        値はすべて直近の実行の値（gauge）で、実行ごとに書き直す。商品ごとの所要時間は系列が商品数だけ
+        増えるため、METRICS_PRODUCT_LATENCY を指定した場合だけ（実行レポートに含めた商品の分を）出力する。
+        """
+        lines = [
+            "# HELP stock_monitor_run_duration_seconds 直近の実行の所要時間",
+            "# TYPE stock_monitor_run_duration_seconds gauge",
+            f"stock_monitor_run_duration_seconds {report['duration']:.6f}",
+            "# HELP stock_monitor_run_timestamp_seconds 直近の実行の開始時刻",
+            "# TYPE stock_monitor_run_timestamp_seconds gauge",
+            f"stock_monitor_run_timestamp_seconds {datetime.fromisoformat(report['started_at']).timestamp():.0f}",
+            "# HELP stock_monitor_phase_seconds 段階ごとの所要時間",
+            "# TYPE stock_monitor_phase_seconds summary",
+        ]
+        for name, summary in sorted(report["phases"].items()):
+            for q in ("0.5", "0.95"):
+                value = summary["p50"] if q == "0.5" else summary["p95"]
+                lines.append(f"stock_monitor_phase_seconds{prometheus_labels(phase=name, quantile=q)} {value:.6f}")
+            lines.append(f"stock_monitor_phase_seconds_sum{prometheus_labels(phase=name)} {summary['total']:.6f}")
+            lines.append(f"stock_monitor_phase_seconds_count{prometheus_labels(phase=name)} {summary['count']}")
+        lines += [
+            "# HELP stock_monitor_events 直近の実行で発生したイベントの件数",
+            "# TYPE stock_monitor_events gauge",
+        ]
+        for name, value in sorted(report["counters"].items()):
+            lines.append(f"stock_monitor_events{prometheus_labels(event=name)} {value}")
+        lines += [
+            "# HELP stock_monitor_products 直近の実行の在庫状況ごとの商品数",
+            "# TYPE stock_monitor_products gauge",
+        ]
+        for status, value in sorted(report["statuses"].items()):
+            lines.append(f"stock_monitor_products{prometheus_labels(status=status)} {value}")
+        lines += [
+            "# HELP stock_monitor_rule_matches 直近の実行で判定に使われたルールごとの商品数",
+            "# TYPE stock_monitor_rule_matches gauge",
+        ]
+        for rule, value in sorted(report["rules"].items()):
+            lines.append(f"stock_monitor_rule_matches{prometheus_labels(rule=rule)} {value}")
+        lines += [
+            "# HELP stock_monitor_errors 直近の実行で取得できなかった商品数（分類: auth / network / parse / other）",
+            "# TYPE stock_monitor_errors gauge",
+        ]
+        for kind, value in sorted(report.get("errors", {}).items()):
+            lines.append(f"stock_monitor_errors{prometheus_labels(kind=kind)} {value}")
+        if METRICS_PRODUCT_LATENCY:
+            lines += [
+                "# HELP stock_monitor_product_latency_seconds 商品ごとの取得から判定までの所要時間",
+                "# TYPE stock_monitor_product_latency_seconds gauge",
+            ]
+            for record in report["products"]:
+                if "latency" in record:
+                    lines.append(
+                        f"stock_monitor_product_latency_seconds{prometheus_labels(url=record['url'])} {record['latency']:.6f}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, report):
+        """実行レポートをPrometheusのテキスト形式で保存する
+
+        node_exporter の textfile collector が書き込み途中のファイルを読まないよう、
+        一時ファイルに書いてから置き換える。
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(report))
+        os.replace(tmp_path, path)
+
+metrics = RunMetrics()
@@ -0,0 +1,391 @@
+"""通知（メール、LINE）
+
+smtplib / email と requests は、そのチャネルで実際に送信する時点で読み込む。
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import (
+    LINE_API_BASE, LINE_CHANNEL_ACCESS_TOKEN, LINE_MAX_MESSAGES_PER_REQUEST, LINE_MAX_TEXT_LENGTH, LINE_USER_ID,
+    NOTIFY_BACKOFF, NOTIFY_CHANNELS, NOTIFY_MAX_RETRIES, NOTIFY_TIMEOUT, RECEIVER_EMAIL, SENDER_EMAIL,
+    SENDER_PASSWORD, SMTP_PORT, SMTP_SERVER, SMTP_STARTTLS,
+)
+from .errors import error_kind
+from .metrics import metrics
+
+def build_email_message(subject, body):
+    """通知メールを作成する"""
+    from email.mime.text import MIMEText
+    msg = MIMEText(body, "plain", "utf-8")
+    msg["Subject"] = subject
+    msg["From"] = SENDER_EMAIL
+    msg["To"] = RECEIVER_EMAIL
+    return msg
+
+class NotificationDispatcher:
+    """実行中の通知をためておき、最後にまとめて送信する
+
+    メールは1つのSMTP接続で続けて送り、LINEは1つのkeep-aliveセッションで
+    1リクエストあたり最大 LINE_MAX_MESSAGES_PER_REQUEST 件のメッセージをまとめて送る。
+    メールとLINEは並行して送信し、LINEの429/5xxはバックオフして再送する。
+    チャネルごとの送信件数、失敗件数、所要時間は stats に記録する。
+    """
+
+    def __init__(self):
+        self.queue = []
+        self.lock = threading.Lock()
+        self.stats = {
+            "email": {"sent": 0, "failed": 0, "requests": 0, "elapsed": 0.0},
+            "line": {"sent": 0, "failed": 0, "requests": 0, "elapsed": 0.0},
+        }
+
+    def add(self, subject, body, channels=NOTIFY_CHANNELS):
+        """通知をキューに追加する（channels のチャネルにだけ送る）"""
+        self.queue.append((subject, body, tuple(channels)))
+
+    def flush(self):
+        """キューにたまった通知をメールとLINEで並行して送信する
+
+        Returns:
+            bool: いずれかのチャネルで1件以上送信できた場合 True
+        """
+        if not self.queue:
+            return False
+        notifications, self.queue = self.queue, []
+
+        emails = [(subject, body) for subject, body, channels in notifications if "email" in channels]
+        # LINEメッセージを作成（件名 + 本文）
+        line_messages = [f"{subject}\n\n{body}" for subject, body, channels in notifications if "line" in channels]
+        email_enabled = bool(SENDER_EMAIL and SENDER_PASSWORD and RECEIVER_EMAIL and emails)
+        line_enabled = bool(LINE_CHANNEL_ACCESS_TOKEN and line_messages)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = []
+            if email_enabled:
+                futures.append(executor.submit(self.send_emails, emails))
+            if line_enabled:
+                futures.append(executor.submit(self.send_line_messages, line_messages))
+            results = [future.result() for future in futures]
+
+        if not any(results):
+            print("警告: メールもLINEも送信されませんでした。環境変数を確認してください。")
+        return any(results)
+
+    def _record(self, channel, sent=0, failed=0, requests_count=0, elapsed=0.0):
+        with self.lock:
+            stats = self.stats[channel]
+            stats["sent"] += sent
+            stats["failed"] += failed
+            stats["requests"] += requests_count
+            stats["elapsed"] += elapsed
+
+    def send_emails(self, notifications):
+        """1つのSMTP接続で複数の通知メールを送信する
+
+        Returns:
+            bool: 1件以上送信できた場合 True
+        """
+        if not SENDER_EMAIL or not SENDER_PASSWORD or not RECEIVER_EMAIL:
+            print("メール通知設定が不完全です。スキップします。")
+            return False
+
+        import smtplib
+        start = time.perf_counter()
+        sent = 0
+        server = None
+        try:
+            for subject, body in notifications:
+                msg = build_email_message(subject, body)
+                # 接続が切れていた場合は1回だけ接続し直して再送する
+                for attempt in range(2):
+                    try:
+                        if server is None:
+                            with metrics.phase("smtp_connect"):
+                                server = self._connect_smtp()
+                        with metrics.phase("notify_email"):
+                            server.send_message(msg)
+                        sent += 1
+                        break
+                    except smtplib.SMTPServerDisconnected:
+                        server = None
+                        if attempt == 1:
+                            raise
+            print(f"メール通知を送信しました。（{sent}件）")
+        except Exception as e:
+            print(f"メールの送信中にエラーが発生しました: {e}")
+        finally:
+            if server is not None:
+                try:
+                    server.quit()
+                except:
+                    pass
+            self._record("email", sent, len(notifications) - sent, 1, time.perf_counter() - start)
+        return sent > 0
+
+    def _connect_smtp(self):
+        import smtplib
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=NOTIFY_TIMEOUT)
+        if SMTP_STARTTLS:
+            server.starttls()
+        server.login(SENDER_EMAIL, SENDER_PASSWORD)
+        return server
+
+    def send_line_messages(self, messages):
+        """LINE Messaging APIで複数のメッセージを送信する（1リクエストに最大5件までまとめる）
+
+        Returns:
+            bool: 1件以上送信できた場合 True
+        """
+        if not LINE_CHANNEL_ACCESS_TOKEN:
+            print("LINE通知設定が不完全です。スキップします。")
+            return False
+
+        start = time.perf_counter()
+        sent = 0
+        import requests
+        requests_count = 0
+        with requests.Session() as session:
+            session.headers.update({
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"
+            })
+            for i in range(0, len(messages), LINE_MAX_MESSAGES_PER_REQUEST):
+                batch = messages[i:i + LINE_MAX_MESSAGES_PER_REQUEST]
+                payload = {
+                    "messages": [
+                        # LINEのテキストメッセージは5000文字まで
+                        {"type": "text", "text": message[:LINE_MAX_TEXT_LENGTH]}
+                        for message in batch
+                    ]
+                }
+                # 特定のユーザーに送る場合
+                if LINE_USER_ID:
+                    url = f"{LINE_API_BASE}/v2/bot/message/push"
+                    payload["to"] = LINE_USER_ID
+                else:
+                    # ブロードキャスト（全友だちに送信）
+                    url = f"{LINE_API_BASE}/v2/bot/message/broadcast"
+
+                ok, attempts = self._post_with_retry(session, url, payload)
+                requests_count += attempts
+                if ok:
+                    sent += len(batch)
+
+        if sent:
+            print(f"LINE通知を送信しました。（{sent}件）")
+        self._record("line", sent, len(messages) - sent, requests_count, time.perf_counter() - start)
+        return sent > 0
+
+    def _post_with_retry(self, session, url, payload):
+        """429/5xxと通信エラーはバックオフして再送する
+
+        Returns:
+            tuple: (送信できたかどうか, 送信したリクエスト数) のタプル
+        """
+        import requests
+        for attempt in range(NOTIFY_MAX_RETRIES + 1):
+            try:
+                with metrics.phase("notify_line"):
+                    response = session.post(url, json=payload, timeout=NOTIFY_TIMEOUT)
+            except requests.RequestException as e:
+                print(f"LINE通知の送信中にエラーが発生しました: {e}")
+                response = None
+
+            if response is not None and response.status_code == 200:
+                return True, attempt + 1
+            if response is not None and response.status_code != 429 and response.status_code < 500:
+                print(f"LINE通知の送信に失敗しました。ステータスコード: {response.status_code}")
+                print(f"レスポンス: {response.text}")
+                return False, attempt + 1
+            if attempt == NOTIFY_MAX_RETRIES:
+                break
+
+            # Retry-After があればそれに従い、なければ指数バックオフ（ゆらぎ付き）
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = NOTIFY_BACKOFF * (2 ** attempt) * (0.5 + random.random())
+            status = response.status_code if response is not None else "通信エラー"
+            print(f"LINE通知を再送します（{status}、{delay:.1f}秒後）")
+            metrics.count("line_retry")
+            time.sleep(delay)
+
+        print("LINE通知の送信に失敗しました。再送回数の上限に達しました。")
+        return False, NOTIFY_MAX_RETRIES + 1
+
+    def summary(self):
+        """チャネルごとの送信結果の要約を返す"""
+        parts = []
+        for channel, label, unit in (("email", "メール", "接続"), ("line", "LINE", "リクエスト")):
+            stats = self.stats[channel]
+            if stats["sent"] or stats["failed"]:
+                parts.append(
+                    f"{label} 送信{stats['sent']}件/失敗{stats['failed']}件 "
+                    f"（{stats['requests']}{unit}, {stats['elapsed']:.2f}秒）"
+                )
+        return " / ".join(parts) if parts else "送信なし"
+
+def send_email_notification(subject, body):
+    """メールで通知を送信する"""
+    return NotificationDispatcher().send_emails([(subject, body)])
+
+def send_line_notification(message):
+    """LINE Messaging APIで通知を送信する"""
+    return NotificationDispatcher().send_line_messages([message])
+
+def send_notification(subject, body):
+    """メールとLINEの両方で通知を送信する（設定されているものだけ）"""
+    dispatcher = NotificationDispatcher()
+    dispatcher.add(subject, body)
+    return dispatcher.flush()
+
+# 通知する状態変化の種類と表示名（在庫状況の変化と、商品情報の変化）
+TRANSITION_LABELS = {
+    "restock": "入荷",
+    "soldout": "在庫切れ",
+    "error": "エラー",
+    "recovered": "復旧",
+    "price_drop": "値下げ",
+    "lead_time": "納期変更",
+    "variant_restock": "規格の入荷",
+}
+
+def new_transitions():
+    """状態変化の集計（種類 -> 商品のリスト）を作る"""
+    return {name: [] for name in TRANSITION_LABELS}
+
+def transition_summary(transitions):
+    """状態変化の件数の要約を返す"""
+    return " / ".join(f"{label} {len(transitions.get(name, []))}件" for name, label in TRANSITION_LABELS.items())
+
+def format_change(item):
+    """値下げ・納期変更の通知で、前回と今回の値を表示する"""
+    def show(value):
+        if value is None:
+            return "表示なし"
+        return f"{value:,}円" if isinstance(value, int) else value
+    variant = f"（{item['variant']}）" if item.get("variant") else ""
+    return f"- 【{item['name']}】{variant}\n  {item['url']}\n  {show(item['previous'])} → {show(item['current'])}"
+
+# エラーの分類ごとの通知の見出しと、確認すべきこと
+ERROR_NOTICES = {
+    "auth": (
+        "以下の商品でCI Medicalにログインできませんでした",
+        "ログイン情報（CI_MEDICAL_USERNAME / CI_MEDICAL_PASSWORD）を確認してください。",
+    ),
+    "network": (
+        "以下の商品でCI Medicalに接続できませんでした",
+        "サイトの障害またはメンテナンスの可能性があります。取得できるようになると復旧通知を送ります。",
+    ),
+    "parse": (
+        "以下の商品で商品ページの在庫表示を読み取れませんでした",
+        "商品ページの構成が変わった可能性があります。商品URLと在庫判定のルールを確認してください。",
+    ),
+    "other": (
+        "以下の商品で在庫状況取得エラーが発生しました",
+        "スクリプトの実行環境を確認してください。",
+    ),
+}
+
+def build_notifications(transitions):
+    """状態変化の集計から通知の (件名, 本文) のリストを作る"""
+    notifications = []
+    if transitions["error"] or transitions["recovered"]:
+        sections = []
+        # エラーは分類ごとにまとめ、確認すべきことを添える
+        for kind, (heading, advice) in ERROR_NOTICES.items():
+            errors = [item for item in transitions["error"] if (error_kind(item["status"]) or "other") == kind]
+            if errors:
+                error_list = "\n".join([f"- 【{item['name']}】\n  {item['url']}\n  {item['status']}" for item in errors])
+                sections.append(f"{heading}:\n\n{error_list}\n\n{advice}")
+        if transitions["recovered"]:
+            recovered_list = "\n".join([f"- 【{item['name']}】\n  {item['url']}\n  現在: {item['status']}" for item in transitions["recovered"]])
+            sections.append(f"以下の商品は在庫状況を取得できるようになりました:\n\n{recovered_list}")
+        subject = "CI Medical 在庫監視エラー" if transitions["error"] else "CI Medical 在庫監視 復旧通知"
+        notifications.append((subject, "\n\n".join(sections)))
+
+    if transitions["soldout"]:
+        soldout_list = "\n".join([f"- 【{item['name']}】\n  {item['url']}" for item in transitions["soldout"]])
+        notifications.append((
+            "CI Medical 在庫切れ通知",
+            f"以下の商品が在庫切れになりました:\n\n{soldout_list}"
+        ))
+
+    # 新たに在庫ありになった商品が1つ以上ある場合に通知
+    if transitions["restock"]:
+        # 在庫ありの商品リストを作成
+        in_stock_summary = []
+        for item in transitions["restock"]:
+            in_stock_summary.append(f"- 【{item['name']}】\n  {item['url']}")
+
+        in_stock_text = "\n".join(in_stock_summary)
+
+        subject = "🎉 CI Medical 在庫通知！"
+        body = f"以下の商品で在庫があります！\n\n{in_stock_text}\n\n今すぐ確認して購入を検討してください。"
+        notifications.append((subject, body))
+
+    # 商品情報の変化（規格ごとの入荷、値下げ、納期・入荷予定の変化）
+    if transitions.get("variant_restock"):
+        variant_list = "\n".join([
+            f"- 【{item['name']}】（{item['variant']}）\n  {item['url']}" for item in transitions["variant_restock"]
+        ])
+        notifications.append((
+            "🎉 CI Medical 在庫通知（規格）",
+            f"以下の商品で、在庫がなかった規格が在庫ありになりました:\n\n{variant_list}"
+        ))
+    if transitions.get("price_drop"):
+        price_list = "\n".join([format_change(item) for item in transitions["price_drop"]])
+        notifications.append(("CI Medical 値下げ通知", f"以下の商品の価格が下がりました:\n\n{price_list}"))
+    if transitions.get("lead_time"):
+        lead_time_list = "\n".join([format_change(item) for item in transitions["lead_time"]])
+        notifications.append((
+            "CI Medical 納期変更通知",
+            f"以下の商品の納期・入荷予定の表示が変わりました:\n\n{lead_time_list}"
+        ))
+    return notifications
+
+def dispatch_transitions(transitions):
+    """状態変化を通知する
+
+    商品ごとに通知チャネルが指定されている場合は、チャネルの組み合わせごとに通知を分ける
+    （チャネルが空の商品は通知しない。notify のない項目はすべてのチャネルに通知する）。
+
+    Returns:
+        NotificationDispatcher: 送信に使ったディスパッチャー（送信結果は stats）
+    """
+    dispatcher = NotificationDispatcher()
+    groups = {}
+    for name, changed in transitions.items():
+        for item in changed:
+            channels = tuple(item.get("notify", NOTIFY_CHANNELS))
+            if not channels:
+                continue
+            groups.setdefault(channels, {key: [] for key in transitions})[name].append(item)
+    for channels, group in groups.items():
+        for subject, body in build_notifications(group):
+            dispatcher.add(subject, body, channels)
+
+    restocked_products = transitions["restock"]
+    if restocked_products:
+        print(f"新たに在庫ありになった商品 {len(restocked_products)}件について通知します。")
+    else:
+        print("新たに在庫ありになった商品はありませんでした。")
+
+    with metrics.phase("notify"):
+        dispatcher.flush()
+    print(f"通知: {dispatcher.summary()}")
+    return dispatcher
+
+def write_status_flag(transitions):
+    """GitHub Actions用に、今回新たに在庫あり/エラーになった商品があるかを記録する"""
+    if transitions["restock"]:
+        flag = "在庫あり"
+    elif transitions["error"]:
+        flag = "エラー"
+    else:
+        flag = "在庫なし"
+    with open("last_stock_status.txt", "w") as f:
+        f.write(flag)
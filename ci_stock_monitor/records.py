@@ -0,0 +1,104 @@
+"""商品ページから取り出した商品の情報（価格、在庫表示、数量・納期、規格）と、実行間の比較
+
+状態ファイルやジャーナルからも読み込むため、BeautifulSoup などの外部ライブラリは読み込まない。
+"""
+import sys
+from collections import namedtuple
+from dataclasses import dataclass
+
+from .config import CHANGE_EVENTS
+
+# 前回の商品情報との差分（variant は規格の表示名。商品全体の変化の場合は None）
+RecordChange = namedtuple("RecordChange", ["kind", "variant", "previous", "current"])
+
+def intern_label(text):
+    """在庫表示などの繰り返し現れる文字列を共有して、多数の商品情報を保持するときのメモリを抑える"""
+    return sys.intern(text) if text else None
+
+@dataclass(frozen=True, slots=True)
+class Variant:
+    """商品ページの規格（サイズ、入数など）の1行"""
+
+    label: str
+    price: int | None = None
+    stock: str | None = None
+
+    def to_list(self):
+        return [self.label, self.price, self.stock]
+
+@dataclass(frozen=True, slots=True)
+class ProductRecord:
+    """1つの商品ページから取り出した商品の情報
+
+    __slots__ を使った変更不可のオブジェクトのため、数千件を保持してもメモリ使用量は小さく、
+    前回と同じかどうかは == だけで判定できる（異なる場合だけ changes で項目ごとに比較する）。
+    """
+
+    name: str
+    price: int | None = None
+    stock_label: str | None = None
+    quantity: int | None = None
+    lead_time: str | None = None
+    variants: tuple = ()
+
+    def to_dict(self):
+        """状態ファイルに保存する形式（値のない項目は省く）に変換する"""
+        data = {"name": self.name}
+        for field in ("price", "stock_label", "quantity", "lead_time"):
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        if self.variants:
+            data["variants"] = [variant.to_list() for variant in self.variants]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict の形式から復元する（data が空の場合や形式が異なる場合は None）"""
+        if not data:
+            return None
+        try:
+            return cls(
+                data["name"],
+                data.get("price"),
+                intern_label(data.get("stock_label")),
+                data.get("quantity"),
+                data.get("lead_time"),
+                tuple(Variant(label, price, intern_label(stock)) for label, price, stock in data.get("variants", ())),
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def changes(self, previous, kinds=CHANGE_EVENTS):
+        """前回の商品情報からの変化を返す
+
+        値下げ（price_drop）、納期・入荷予定の表示の変化（lead_time）、在庫ありでなかった規格が
+        在庫ありになった変化（variant_restock）のうち、kinds に含まれるものだけを返す。
+        前回の情報がない場合（初めてのチェック）は変化とみなさない。
+
+        Returns:
+            list: RecordChange のリスト
+        """
+        if previous is None or previous == self:
+            return []
+
+        changes = []
+        if "price_drop" in kinds and _dropped(previous.price, self.price):
+            changes.append(RecordChange("price_drop", None, previous.price, self.price))
+        if "lead_time" in kinds and previous.lead_time != self.lead_time:
+            changes.append(RecordChange("lead_time", None, previous.lead_time, self.lead_time))
+
+        if self.variants != previous.variants:
+            previous_variants = {variant.label: variant for variant in previous.variants}
+            for variant in self.variants:
+                before = previous_variants.get(variant.label)
+                if before is None:
+                    continue
+                if "price_drop" in kinds and _dropped(before.price, variant.price):
+                    changes.append(RecordChange("price_drop", variant.label, before.price, variant.price))
+                if "variant_restock" in kinds and variant.stock == "在庫あり" and before.stock != "在庫あり":
+                    changes.append(RecordChange("variant_restock", variant.label, before.stock, variant.stock))
+        return changes
+
+def _dropped(previous, current):
+    return previous is not None and current is not None and current < previous
@@ -0,0 +1,289 @@
+"""1回分のチェック（監視リストの展開、チェック、状態の保存、通知）と、シャードの状態のマージ"""
+import os
+from datetime import datetime
+from itertools import islice
+
+from .config import (
+    FETCH_CACHE_FILE, HISTORY_FILE, IMMEDIATE_JOURNAL_FILE, JOURNAL_FILE, LAST_STATUS_FILE, NOTIFY_CHANNELS,
+    PENDING_NOTIFICATIONS_FILE, REPORT_PRODUCTS, SCHEDULE_FILE,
+)
+from .fetchers import circuit_breaker, iter_check_products
+from .metrics import metrics
+from .notifiers import dispatch_transitions, new_transitions, transition_summary, write_status_flag
+from .records import ProductRecord
+from .state import (
+    CheckResult, HistoryStore, RunJournal, load_last_status, read_json_file, save_current_status, state_path,
+    update_stock_state, write_json_atomic,
+)
+
+def run_once(args, watch_items, scheduler=None, http_session=None, browser_pool=None, immediate=False):
+    """チェック時刻を迎えた商品（scheduler がない場合はすべての商品）を1回チェックして通知する
+
+    監視リストのカテゴリー/検索結果ページは毎回商品に展開し、一覧の表示で在庫状況を判定できた商品は
+    商品ページを開かずにその結果を使う。
+    http_session / browser_pool を指定した場合は、そのログイン済みのセッションとChromeを使い続ける（閉じない）。
+    immediate を指定した場合は watch_items の商品だけをチェック時刻に関係なくすぐにチェックし、
+    ほかの商品の在庫状況はそのまま残す（常駐モードの即時チェック用）。
+
+    チェック結果は1件ずつ処理し、実行中に保持するのは監視対象のURLと在庫状況（状態ファイルの内容）、
+    状態変化のあった商品、集計したメトリクスだけにする。監視対象のURLと在庫状況は商品数に比例するが、
+    チェック結果や商品ごとの所要時間は商品数が増えても溜め込まない。
+
+    Returns:
+        tuple: (今回の監視対象の商品の WatchItem のリスト（一覧ページから展開した商品を含む）, 実行レポート)
+    """
+    # requests と BeautifulSoup は、チェックする実行でだけ読み込む（--merge などでは読み込まない）
+    from .fetchers.http import FetchCache, HttpSession, expand_listing
+
+    print(f"[{datetime.now()}] 在庫状況を確認中... (取得方式: {args.backend}, 並行数: {args.concurrency})")
+    # 即時チェックは要求元に商品ごとの結果を返すため、すべての商品の記録を残す
+    metrics.reset(product_limit=None if immediate else REPORT_PRODUCTS)
+    own_session = http_session is None
+    if own_session:
+        http_session = HttpSession()
+
+    # カテゴリー/検索結果ページを商品に展開する（展開した商品は一覧ページの設定を引き継ぐ）
+    items = [item for item in watch_items if item.kind == "product"]
+    listing_products = []
+    for listing in (item for item in watch_items if item.kind == "listing" and not immediate):
+        try:
+            expanded = expand_listing(listing.url, http_session)
+        except Exception as e:
+            print(f"一覧ページを展開できませんでした: {listing.url} ({e})")
+            metrics.count("listing_error")
+            continue
+        items += [listing._replace(url=product[0], kind="product") for product in expanded]
+        listing_products += expanded
+    unique_items = {}
+    for item in items:
+        unique_items.setdefault(item.url, item)
+    if scheduler is not None:
+        scheduler.configure(unique_items.values())
+
+    # 前回の状況を読み込み（今回チェックしない商品は前回の状況を引き継ぐ）
+    last_status_dict = load_last_status(state_path(args, LAST_STATUS_FILE))
+    if immediate:
+        current_status_dict = last_status_dict
+    else:
+        current_status_dict = {url: last_status_dict[url] for url in unique_items if url in last_status_dict}
+
+    # 途中で終了した実行があれば、チェック済みの商品の結果を引き継ぐ
+    # （即時チェックは再開しないが、中断した定期チェックのジャーナルを上書きしないよう別のファイルに書く）
+    journal = RunJournal(state_path(args, IMMEDIATE_JOURNAL_FILE if immediate else JOURNAL_FILE))
+    resumed = [] if args.no_resume or immediate else [result for result in journal.load() if result.url in unique_items]
+    resumed_urls = {result.url for result in resumed}
+    if resumed:
+        print(f"中断した実行を再開します（チェック済み {len(resumed)}件を飛ばします）")
+
+    # 一覧ページで在庫状況を判定できた商品は、商品ページを開かない
+    listing_results = [
+        CheckResult(url, name, status, rule, 0.0)
+        for url, name, status, rule in listing_products
+        if status is not None and url not in resumed_urls
+    ]
+    listed_urls = {result.url for result in listing_results}
+
+    # 今回チェックする商品を選ぶ
+    pending_urls = (url for url in unique_items if url not in resumed_urls and url not in listed_urls)
+    if immediate:
+        due_urls = list(pending_urls)
+    elif scheduler is not None:
+        due_urls = scheduler.due(pending_urls, limit=args.max_products)
+        print(f"チェック対象: {len(due_urls)}件 / 全{len(unique_items)}件（一覧で判定 {len(listing_results)}件）")
+    else:
+        due_urls = islice(pending_urls, args.max_products) if args.max_products else pending_urls
+
+    # 前回からの状態変化を集計する
+    transitions = new_transitions()
+
+    def process(result):
+        product_url, product_name, current_status = result.url, result.name, result.status
+        entry = current_status_dict.setdefault(product_url, {})
+        transition = update_stock_state(entry, product_name, current_status)
+        if scheduler is not None:
+            scheduler.record(product_url, current_status)
+
+        if current_status == "在庫あり":
+            print(f"在庫あり: {product_name} ({product_url})")
+        notify = list(unique_items[product_url].notify if product_url in unique_items else NOTIFY_CHANNELS)
+        if transition:
+            transitions[transition].append({
+                "url": product_url,
+                "name": entry["name"],
+                "status": current_status,
+                "notify": notify,
+            })
+
+        # 商品情報（価格、納期、規格）は前回の記録と比べる（取得できなかった場合は前回の記録を残す）
+        if result.record is not None:
+            previous = ProductRecord.from_dict(entry.get("record"))
+            for change in result.record.changes(previous):
+                transitions[change.kind].append({
+                    "url": product_url,
+                    "name": entry["name"],
+                    "status": current_status,
+                    "notify": notify,
+                    "variant": change.variant,
+                    "previous": change.previous,
+                    "current": change.current,
+                })
+            entry["record"] = result.record.to_dict()
+
+    for result in resumed:
+        process(result)
+
+    # 各商品の在庫状況を並行してチェックし、結果を1件ずつジャーナルと履歴に書き込みながら処理する
+    fetch_cache = None if args.no_cache else FetchCache(state_path(args, FETCH_CACHE_FILE))
+    checked = 0
+    journal.start(resumed=bool(resumed))
+    try:
+        with metrics.phase("check_products"), HistoryStore(state_path(args, HISTORY_FILE)) as history:
+            for result in listing_results:
+                journal.append(result)
+                history.record([result])
+                process(result)
+            for result in iter_check_products(
+                due_urls, args.backend, args.concurrency, args.browser_profile, fetch_cache, http_session, browser_pool
+            ):
+                journal.append(result)
+                with metrics.phase("save_history"):
+                    history.record([result])
+                process(result)
+                checked += 1
+    finally:
+        journal.close()
+        if own_session:
+            http_session.close()
+
+    # 通知はURLリストの順序で並べる
+    notified = {item["url"] for items in transitions.values() for item in items}
+    order = {url: i for i, url in enumerate(unique_items) if url in notified}
+    for items in transitions.values():
+        items.sort(key=lambda item: order[item["url"]])
+
+    # 現在の状況を保存
+    with metrics.phase("save_status"):
+        save_current_status(current_status_dict, state_path(args, LAST_STATUS_FILE))
+    if scheduler is not None:
+        with metrics.phase("save_schedule"):
+            scheduler.save()
+    if fetch_cache is not None:
+        with metrics.phase("save_cache"):
+            fetch_cache.save()
+        print(f"\nキャッシュ: {fetch_cache.hits}件は前回の判定結果を使用、{fetch_cache.misses}件を取得・判定し直しました。")
+    open_hosts = circuit_breaker.open_hosts()
+    if open_hosts:
+        print(f"通信エラーが続いたため取得を中止したホスト: {', '.join(open_hosts)}")
+
+    print(f"状態変化: {transition_summary(transitions)}")
+
+    # 通知処理（状態が変化した商品だけ。実行の最後にまとめて送信する）
+    # シャード実行では通知せずに書き出し、--merge でほかのシャードの分とまとめて通知する
+    dispatcher = None
+    if args.shard is not None:
+        write_json_atomic(state_path(args, PENDING_NOTIFICATIONS_FILE), transitions, indent=2)
+        print(f"シャード {args.shard[0]}/{args.shard[1]}: 状態変化を {state_path(args, PENDING_NOTIFICATIONS_FILE)} に書き出しました。")
+    else:
+        dispatcher = dispatch_transitions(transitions)
+    # 状態の保存と通知が終わったので、次の実行では再開しない
+    journal.complete()
+
+    # 即時チェックの結果で、直近の定期チェックの GitHub Actions 用の結果を上書きしない
+    if args.shard is None and not immediate:
+        write_status_flag(transitions)
+
+    report = metrics.report(
+        backend=args.backend,
+        concurrency=args.concurrency,
+        products_total=len(unique_items),
+        products_checked=checked,
+        products_listed=len(listing_results),
+        products_resumed=len(resumed),
+        transitions={name: len(items) for name, items in transitions.items()},
+        cache={"hits": fetch_cache.hits, "misses": fetch_cache.misses} if fetch_cache is not None else None,
+        circuit_open=open_hosts,
+        notifications=dispatcher.stats if dispatcher is not None else None,
+        shard=f"{args.shard[0]}/{args.shard[1]}" if args.shard is not None else None,
+    )
+    # 即時チェックの結果で、直近の定期チェックの実行レポートを上書きしない
+    if not immediate:
+        write_run_report(args, report)
+    return list(unique_items.values()), report
+
+def write_run_report(args, report):
+    """段階ごとの所要時間を表示し、実行レポートとメトリクスファイルを書き出す"""
+    phases = sorted(report["phases"].items(), key=lambda item: item[1]["total"], reverse=True)
+    print(f"\n段階ごとの所要時間（合計 {report['duration']:.1f}秒）:")
+    for name, summary in phases:
+        print(
+            f"  {name:<16} {summary['count']:>4}回 合計 {summary['total']:>7.2f}秒 / "
+            f"p50 {summary['p50']:.2f}秒 / p95 {summary['p95']:.2f}秒 / 最大 {summary['max']:.2f}秒"
+        )
+
+    if args.report:
+        metrics.write_report(args.report, report)
+        print(f"実行レポートを保存しました: {args.report}")
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file, report)
+        print(f"メトリクスを保存しました: {args.metrics_file}")
+
+def merge_shards(args, shard_dirs):
+    """シャードごとの状態ファイルを --state-dir（省略時はカレントディレクトリ）の状態ファイルにまとめる
+
+    各シャードの在庫状況に含まれる商品（そのシャードが担当した商品）について、
+    在庫状況、スケジュール、キャッシュの項目を置き換え、履歴を取り込む。
+    結果が見つからないシャードの商品は、前回の状態をそのまま残す。
+    状態変化はURLごとに重複を除いて1回だけ通知する。
+    """
+    metrics.reset()
+    status = load_last_status(state_path(args, LAST_STATUS_FILE))
+    schedule = read_json_file(state_path(args, SCHEDULE_FILE), {})
+    cache = read_json_file(state_path(args, FETCH_CACHE_FILE), {})
+    transitions = new_transitions()
+    notified = set()
+    merged_urls = set()
+
+    with HistoryStore(state_path(args, HISTORY_FILE)) as history:
+        for shard_dir in shard_dirs:
+            status_path = os.path.join(shard_dir, LAST_STATUS_FILE)
+            if not os.path.exists(status_path):
+                print(f"警告: {shard_dir} に在庫状況のファイルがありません。スキップします。")
+                continue
+            shard_status = load_last_status(status_path)
+            # 複数のシャードに同じ商品がある場合は、先に指定したシャードを使う
+            urls = set(shard_status) - merged_urls
+            merged_urls |= urls
+            status.update({url: shard_status[url] for url in urls})
+            for filename, merged in ((SCHEDULE_FILE, schedule), (FETCH_CACHE_FILE, cache)):
+                entries = read_json_file(os.path.join(shard_dir, filename), {})
+                merged.update({url: entry for url, entry in entries.items() if url in urls})
+
+            history_path = os.path.join(shard_dir, HISTORY_FILE)
+            observations = history.merge(history_path) if os.path.exists(history_path) else 0
+
+            pending = read_json_file(os.path.join(shard_dir, PENDING_NOTIFICATIONS_FILE), {})
+            for name, items in pending.items():
+                for item in items:
+                    # 規格ごとの変化は、同じ商品でも規格ごとに通知する
+                    key = (name, item["url"], item.get("variant"))
+                    if item["url"] in urls and key not in notified:
+                        notified.add(key)
+                        transitions[name].append(item)
+            print(f"{shard_dir}: 商品 {len(urls)}件、履歴 {observations}件を取り込みました。")
+
+    save_current_status(status, state_path(args, LAST_STATUS_FILE))
+    write_json_atomic(state_path(args, SCHEDULE_FILE), schedule)
+    write_json_atomic(state_path(args, FETCH_CACHE_FILE), cache)
+
+    order = {url: i for i, url in enumerate(status)}
+    for items in transitions.values():
+        items.sort(key=lambda item: order.get(item["url"], len(order)))
+    print(f"状態変化: {transition_summary(transitions)}")
+    dispatch_transitions(transitions)
+    write_status_flag(transitions)
+
+    # 同じシャードの結果をもう一度マージしても、通知が繰り返されないようにする
+    for shard_dir in shard_dirs:
+        pending_path = os.path.join(shard_dir, PENDING_NOTIFICATIONS_FILE)
+        if os.path.exists(pending_path):
+            os.remove(pending_path)
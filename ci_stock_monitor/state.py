@@ -0,0 +1,475 @@
+"""実行をまたいで保存する状態（在庫状況、ジャーナル、チェック間隔、在庫履歴）"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from .config import (
+    ERROR_CONFIRMATIONS, HISTORY_FILE, HOT_PERIOD, JOURNAL_FILE, LAST_STATUS_FILE, MAX_POLL_INTERVAL,
+    MIN_POLL_INTERVAL, POLL_BACKOFF, RESTOCK_CONFIRMATIONS, RESUME_WINDOW, SCHEDULE_FILE, SCHEDULE_TOLERANCE,
+    SOLDOUT_CONFIRMATIONS,
+)
+from .records import ProductRecord
+
+# 1商品のチェック結果（latency は取得から判定までの秒数、record は商品ページから取り出した ProductRecord）
+CheckResult = namedtuple("CheckResult", ["url", "name", "status", "rule", "latency", "record"], defaults=[None])
+
+def update_stock_state(entry, product_name, status):
+    """商品の状態を更新し、通知すべき状態変化を返す
+
+    在庫状況の変化は、同じ状況が必要な回数（RESTOCK_CONFIRMATIONS / SOLDOUT_CONFIRMATIONS /
+    ERROR_CONFIRMATIONS）続けて観測された時点で確定させる。ページの表示が不安定でも通知が
+    何度も出ないようにするため。
+
+    Args:
+        entry: last_stock_status.json の商品ごとの状態（この関数内で更新される）
+        product_name: 商品名
+        status: 今回の在庫状況
+
+    Returns:
+        str: "restock"（在庫なし→在庫あり）, "soldout"（在庫あり→在庫なし）,
+             "error"（正常→エラー）, "recovered"（エラー→正常）, または None
+    """
+    # 旧形式（name と status だけ）の状態から引き継ぐ
+    if "stable_status" not in entry:
+        previous = entry.get("status")
+        entry["stable_status"] = previous if previous in ("在庫あり", "在庫なし") else None
+        entry["in_error"] = False
+
+    entry["status"] = status
+    if not product_name.startswith("商品ID: ") or "name" not in entry:
+        entry["name"] = product_name
+
+    if status.startswith("エラー"):
+        if entry["in_error"]:
+            return None
+        observed, required = "エラー", ERROR_CONFIRMATIONS
+    else:
+        if entry["in_error"]:
+            entry["in_error"] = False
+            entry.pop("pending_status", None)
+            entry.pop("pending_count", None)
+            transition = "recovered"
+        else:
+            transition = None
+
+        if status == entry["stable_status"]:
+            entry.pop("pending_status", None)
+            entry.pop("pending_count", None)
+            return transition
+        if transition:
+            # 復旧と同時に在庫状況が変わった場合は確認を待たずに確定する（入荷なら入荷として通知する）
+            entry["stable_status"] = status
+            return "restock" if status == "在庫あり" else transition
+        observed = status
+        required = RESTOCK_CONFIRMATIONS if status == "在庫あり" else SOLDOUT_CONFIRMATIONS
+
+    # 同じ変化が続けて観測された回数を数える
+    if entry.get("pending_status") == observed:
+        entry["pending_count"] += 1
+    else:
+        entry["pending_status"] = observed
+        entry["pending_count"] = 1
+    if entry["pending_count"] < required:
+        return None
+
+    entry.pop("pending_status", None)
+    entry.pop("pending_count", None)
+    if observed == "エラー":
+        entry["in_error"] = True
+        return "error"
+
+    previous = entry["stable_status"]
+    entry["stable_status"] = observed
+    if observed == "在庫あり":
+        return "restock"
+    # 初めてのチェックで在庫なしの場合は通知しない
+    return "soldout" if previous is not None else None
+
+def write_json_atomic(path, data, **kwargs):
+    """JSONを一時ファイルに書いてから置き換える（書き込み中に終了しても元のファイルが壊れない）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp_path, path)
+
+def load_last_status(path=LAST_STATUS_FILE):
+    """前回の在庫状況を読み込む"""
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except:
+            return {}
+    return {}
+
+def save_current_status(status_dict, path=LAST_STATUS_FILE):
+    """現在の在庫状況を保存する（毎回すべての商品を書き直すため、インデントなしで書く）"""
+    write_json_atomic(path, status_dict, separators=(",", ":"))
+
+class RunJournal:
+    """実行中のチェック結果を1件ずつ追記するジャーナル（JSON Lines）
+
+    1行目に実行の開始時刻、以降の各行に CheckResult を書き、1件ごとにディスクへ書き出す。
+    実行が途中で終了した場合、次の実行は開始から RESUME_WINDOW 秒以内であれば、
+    ジャーナルの結果から状態の更新と通知をやり直し、チェック済みの商品を飛ばす。
+    実行が最後まで終わったらジャーナルを削除する。
+    """
+
+    def __init__(self, path=JOURNAL_FILE, window=RESUME_WINDOW):
+        self.path = path
+        self.window = window
+        self.started_at = None
+        self.file = None
+
+    def load(self, now=None):
+        """中断した実行のチェック結果を読み込む（再開できない場合は空のリスト）
+
+        Returns:
+            list: CheckResult のリスト
+        """
+        now = time.time() if now is None else now
+        if not os.path.exists(self.path):
+            return []
+
+        results = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if now - header["started_at"] > self.window:
+                    return []
+                self.started_at = header["started_at"]
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で終了した行は読み飛ばす
+                        continue
+                    record["record"] = ProductRecord.from_dict(record.get("record"))
+                    results.append(CheckResult(**record))
+        except (OSError, ValueError, KeyError, TypeError):
+            return []
+        return results
+
+    def start(self, resumed=False):
+        """ジャーナルを開く（resumed が False の場合は新しい実行として書き直す）"""
+        if resumed:
+            self.file = open(self.path, "a", encoding="utf-8")
+            return
+        self.started_at = time.time()
+        self.file = open(self.path, "w", encoding="utf-8")
+        self._write({"started_at": self.started_at})
+
+    def append(self, result):
+        """チェック結果を1件追記する"""
+        record = result._asdict()
+        if result.record is not None:
+            record["record"] = result.record.to_dict()
+        self._write(record)
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def complete(self):
+        """実行が最後まで終わったのでジャーナルを削除する"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class PollScheduler:
+    """商品ごとの次回チェック時刻を管理し、今回チェックすべき商品を選ぶ
+
+    在庫ありの商品と、最近在庫状況が変わった商品（HOT_PERIOD 以内）は最短間隔でチェックする。
+    それ以外の商品は変化がないたびに間隔を POLL_BACKOFF 倍に延ばし、最長 max_interval まで空ける。
+    取得エラーになった商品は最短間隔で再チェックする。
+    """
+
+    def __init__(self, path=SCHEDULE_FILE, min_interval=MIN_POLL_INTERVAL,
+                 max_interval=MAX_POLL_INTERVAL, backoff=POLL_BACKOFF):
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self.entries = {}
+        # 監視リストで商品ごとに指定された最短チェック間隔と優先度
+        self.intervals = {}
+        self.priorities = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except:
+                self.entries = {}
+
+    def due(self, product_urls, now=None, limit=None):
+        """チェック時刻を迎えた商品を返す
+
+        limit を指定した場合は、優先度の高い商品、予定時刻を最も過ぎている商品の順に limit 件を選ぶ。
+
+        Returns:
+            list: チェックすべき商品URL（product_urls の順序）
+        """
+        now = time.time() if now is None else now
+        due_urls = [
+            url for url in product_urls
+            if self.entries.get(url, {}).get("next_check", 0) <= now + SCHEDULE_TOLERANCE
+        ]
+        if limit is not None and len(due_urls) > limit:
+            selected = set(sorted(
+                due_urls,
+                key=lambda url: (-self.priorities.get(url, 0), self.entries.get(url, {}).get("next_check", 0)),
+            )[:limit])
+            due_urls = [url for url in due_urls if url in selected]
+        return due_urls
+
+    def next_due_time(self, product_urls):
+        """いずれかの商品が次にチェック時刻を迎える時刻を返す"""
+        return min((self.entries.get(url, {}).get("next_check", 0) for url in product_urls), default=0)
+
+    def configure(self, items):
+        """監視リストの商品ごとの最短チェック間隔と優先度を設定する"""
+        for item in items:
+            if item.poll_interval:
+                self.intervals[item.url] = item.poll_interval
+            if item.priority:
+                self.priorities[item.url] = item.priority
+
+    def record(self, url, status, now=None):
+        """チェック結果を記録し、次回チェック時刻を決める"""
+        now = time.time() if now is None else now
+        entry = self.entries.setdefault(url, {})
+        min_interval = self.intervals.get(url, self.min_interval)
+        max_interval = max(min_interval, self.max_interval)
+
+        if status.startswith("エラー"):
+            interval = min_interval
+        else:
+            # 初めてのチェックは変化とみなさない
+            if "last_status" in entry and entry["last_status"] != status:
+                entry["last_change"] = now
+            entry["last_status"] = status
+
+            recently_changed = now - entry.get("last_change", 0) < HOT_PERIOD
+            if status == "在庫あり" or recently_changed:
+                interval = min_interval
+            else:
+                interval = min(max(entry.get("interval", min_interval), min_interval) * self.backoff, max_interval)
+
+        entry["interval"] = interval
+        entry["last_check"] = now
+        entry["next_check"] = now + interval
+
+    def save(self):
+        """スケジュールをファイルに保存する"""
+        write_json_atomic(self.path, self.entries)
+
+class HistoryStore:
+    """チェック結果を追記していくSQLiteの履歴データベース
+
+    商品URLと商品名は products テーブルに1回だけ保存し、各チェック結果（在庫状況、判定ルール、
+    取得時間）は observations テーブルに追記する。(商品, 時刻) のインデックスにより、
+    行数が数十万件になっても商品ごとの問い合わせは高速に行える。
+    WALモードとロックにより、並行チェックのスレッドや複数プロセスから同時に書き込める。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL UNIQUE,
+        name TEXT
+    );
+    CREATE TABLE IF NOT EXISTS observations (
+        product_id INTEGER NOT NULL REFERENCES products(id),
+        checked_at REAL NOT NULL,
+        status TEXT NOT NULL,
+        rule TEXT,
+        latency_ms INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_observations_product_time
+        ON observations (product_id, checked_at);
+    CREATE INDEX IF NOT EXISTS idx_observations_product_status_time
+        ON observations (product_id, status, checked_at);
+    """
+
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn:
+            self.conn.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _product_id(self, url, name=None):
+        """商品IDを返す（未登録の場合は登録し、商品名が変わっていれば更新する）"""
+        row = self.conn.execute("SELECT id, name FROM products WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return self.conn.execute(
+                "INSERT INTO products (url, name) VALUES (?, ?)", (url, name)
+            ).lastrowid
+        product_id, current_name = row
+        if name and name != current_name and not name.startswith("商品ID: "):
+            self.conn.execute("UPDATE products SET name = ? WHERE id = ?", (name, product_id))
+        return product_id
+
+    def record(self, results, checked_at=None):
+        """チェック結果（CheckResult のリスト）を1つのトランザクションで追記する"""
+        checked_at = time.time() if checked_at is None else checked_at
+        with self.lock, self.conn:
+            for result in results:
+                product_id = self._product_id(result.url, result.name)
+                self.conn.execute(
+                    "INSERT INTO observations (product_id, checked_at, status, rule, latency_ms)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (product_id, checked_at, result.status, result.rule, int(result.latency * 1000)),
+                )
+
+    def merge(self, path):
+        """別の履歴データベース（シャードごとの実行結果など）のチェック結果を取り込む
+
+        同じ商品・同じ時刻のチェック結果がすでにある場合は取り込まない（同じファイルを2回取り込んでもよい）。
+
+        Returns:
+            int: 取り込んだチェック結果の件数
+        """
+        with self.lock:
+            self.conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            try:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO products (url, name) SELECT url, name FROM shard.products"
+                    )
+                    return self.conn.execute(
+                        "INSERT INTO observations (product_id, checked_at, status, rule, latency_ms)"
+                        " SELECT p.id, o.checked_at, o.status, o.rule, o.latency_ms"
+                        " FROM shard.observations o"
+                        " JOIN shard.products sp ON sp.id = o.product_id"
+                        " JOIN products p ON p.url = sp.url"
+                        " WHERE NOT EXISTS (SELECT 1 FROM observations e"
+                        "  WHERE e.product_id = p.id AND e.checked_at = o.checked_at)"
+                    ).rowcount
+            finally:
+                self.conn.execute("DETACH DATABASE shard")
+
+    def last_in_stock(self, url):
+        """最後に在庫ありと判定された時刻を返す（一度もない場合は None）"""
+        row = self.conn.execute(
+            "SELECT MAX(o.checked_at) FROM observations o JOIN products p ON p.id = o.product_id"
+            " WHERE p.url = ? AND o.status = '在庫あり'",
+            (url,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def stock_periods(self, url):
+        """在庫状況が変わった時点の一覧を返す（エラーは除く）
+
+        Returns:
+            list: (時刻, 在庫ありかどうか) のリスト（古い順）
+        """
+        rows = self.conn.execute(
+            """
+            WITH obs AS (
+                SELECT o.checked_at, o.status = '在庫あり' AS in_stock,
+                       LAG(o.status = '在庫あり') OVER (ORDER BY o.checked_at) AS prev_in_stock
+                FROM observations o JOIN products p ON p.id = o.product_id
+                WHERE p.url = ? AND o.status NOT LIKE 'エラー%'
+            )
+            SELECT checked_at, in_stock FROM obs
+            WHERE prev_in_stock IS NULL OR in_stock != prev_in_stock
+            ORDER BY checked_at
+            """,
+            (url,),
+        ).fetchall()
+        return [(checked_at, bool(in_stock)) for checked_at, in_stock in rows]
+
+    def summary(self, url, now=None):
+        """商品の在庫履歴の要約を返す
+
+        Returns:
+            dict: 観測数、最後に在庫ありだった時刻、再入荷回数、1日あたりの再入荷回数、平均在庫期間（秒）
+        """
+        now = time.time() if now is None else now
+        count, first_seen = self.conn.execute(
+            "SELECT COUNT(*), MIN(o.checked_at) FROM observations o JOIN products p ON p.id = o.product_id"
+            " WHERE p.url = ?",
+            (url,),
+        ).fetchone()
+        changes = self.stock_periods(url)
+
+        # 在庫なし -> 在庫あり になった回数（最初の観測は含めない）
+        restocks = sum(1 for checked_at, in_stock in changes[1:] if in_stock)
+
+        # 在庫ありになってから在庫なしになるまでの期間（終わっていない期間は含めない）
+        durations = [
+            end[0] - start[0]
+            for start, end in zip(changes, changes[1:])
+            if start[1] and not end[1]
+        ]
+
+        observed_days = (now - first_seen) / 86400 if first_seen else 0
+        return {
+            "observations": count,
+            "last_in_stock": self.last_in_stock(url),
+            "restocks": restocks,
+            "restocks_per_day": restocks / observed_days if observed_days > 0 else 0.0,
+            "mean_time_in_stock": sum(durations) / len(durations) if durations else None,
+        }
+
+def print_history_report(product_urls, history_file=HISTORY_FILE):
+    """商品ごとの在庫履歴の要約を表示する"""
+    if not os.path.exists(history_file):
+        print(f"履歴ファイルがありません: {history_file}")
+        return
+
+    with HistoryStore(history_file) as history:
+        for url in product_urls:
+            summary = history.summary(url)
+            row = history.conn.execute("SELECT name FROM products WHERE url = ?", (url,)).fetchone()
+            name = row[0] if row and row[0] else url.split("/")[-1]
+
+            last_in_stock = (
+                datetime.fromtimestamp(summary["last_in_stock"]).strftime("%Y-%m-%d %H:%M")
+                if summary["last_in_stock"] else "なし"
+            )
+            mean_time = (
+                f"{summary['mean_time_in_stock'] / 3600:.1f}時間"
+                if summary["mean_time_in_stock"] is not None else "-"
+            )
+            print(f"【{name}】 {url}")
+            print(
+                f"  観測数: {summary['observations']} / 最後に在庫あり: {last_in_stock} / "
+                f"再入荷: {summary['restocks']}回（{summary['restocks_per_day']:.2f}回/日） / "
+                f"平均在庫期間: {mean_time}"
+            )
+
+def state_path(args, filename):
+    """状態ファイルのパス（--state-dir を指定した場合はそのディレクトリの中）"""
+    return os.path.join(args.state_dir, filename) if args.state_dir else filename
+
+def read_json_file(path, default):
+    """JSONファイルを読み込む（存在しない、または壊れている場合は default）"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
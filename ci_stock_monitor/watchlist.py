@@ -0,0 +1,133 @@
+"""監視リストの読み込みと、シャード実行での商品の割り当て"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+
+from .config import NOTIFY_CHANNELS, PRODUCT_URLS, PRODUCT_URL_TEMPLATE
+
+# 一覧ページの商品リンク（/catalog_item/商品ID）
+PRODUCT_LINK_PATTERN = re.compile(r"/catalog_item/([^/?#]+)")
+
+# 監視リストの1項目（kind は "product"（商品ページ）または "listing"（カテゴリー/検索結果ページ））
+WatchItem = namedtuple("WatchItem", ["url", "priority", "poll_interval", "notify", "kind"])
+
+def make_watch_item(record, source):
+    """監視リストの1行（URL/商品IDの文字列、または設定の辞書）から WatchItem を作る"""
+    if isinstance(record, str):
+        record = {"url": record}
+    url = str(record.get("url") or record.get("id") or "").strip()
+    if not url:
+        raise ValueError(f"{source}: url がありません")
+    if "/" not in url:
+        url = PRODUCT_URL_TEMPLATE.format(id=url)
+
+    # notify の項目がない場合だけすべてのチャネルに通知する（空の値や none は通知しない）
+    notify = record.get("notify")
+    if notify is None:
+        notify = NOTIFY_CHANNELS
+    else:
+        if isinstance(notify, str):
+            notify = re.split(r"[\s,;|]+", notify)
+        notify = [channel for channel in (str(value).strip().lower() for value in notify) if channel not in ("", "none")]
+    unknown = set(notify) - set(NOTIFY_CHANNELS)
+    if unknown:
+        raise ValueError(f"{source}: 不明な通知チャネルです: {', '.join(sorted(unknown))}")
+
+    kind = str(record.get("type") or ("product" if "/catalog_item/" in url else "listing")).strip()
+    if kind not in ("product", "listing"):
+        raise ValueError(f"{source}: type は product または listing を指定してください: {kind}")
+
+    poll_interval = record.get("poll_interval")
+    return WatchItem(
+        url=url,
+        priority=int(record.get("priority") or 0),
+        poll_interval=int(poll_interval) if poll_interval not in (None, "") else None,
+        notify=tuple(channel for channel in NOTIFY_CHANNELS if channel in notify),
+        kind=kind,
+    )
+
+def load_watchlist(path):
+    """監視リストをファイルから読み込む
+
+    形式は拡張子で判断する。
+    - .csv: 見出し行に url（または id）, priority, poll_interval, notify, type の列
+    - .yaml / .yml / .json: 上記をキーとする辞書、またはURLの文字列のリスト（"items" キーの下でもよい）
+    - .txt: 1行に1つのURLまたは商品ID（# 以降はコメント）
+    商品IDだけの項目は PRODUCT_URL_TEMPLATE で商品URLにする。同じURLは最初の項目だけを使い、
+    優先度（priority）の高い順に並べて返す。
+
+    Returns:
+        list: WatchItem のリスト
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if ext == ".csv":
+            records = [
+                row for row in csv.DictReader(line for line in f if not line.lstrip().startswith("#"))
+                if any((value or "").strip() for value in row.values())
+            ]
+        elif ext in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("YAML形式の監視リストを読み込むには PyYAML が必要です（pip install pyyaml）")
+            records = yaml.safe_load(f) or []
+        elif ext == ".json":
+            records = json.load(f)
+        elif ext == ".txt":
+            records = [line.split("#", 1)[0].strip() for line in f]
+            records = [record for record in records if record]
+        else:
+            raise ValueError(f"監視リストの形式に対応していません: {path}")
+
+    if isinstance(records, dict):
+        records = records.get("items") or []
+
+    items = {}
+    for i, record in enumerate(records, 1):
+        item = make_watch_item(record, f"{path}:{i}")
+        items.setdefault(item.url, item)
+    return sorted(items.values(), key=lambda item: -item.priority)
+
+def load_watch_items(args):
+    """コマンドライン引数に応じて監視リストを返す（--url > --watchlist > PRODUCT_URLS の順）"""
+    if args.urls:
+        return [make_watch_item(url, "--url") for url in args.urls]
+    if args.watchlist:
+        return load_watchlist(args.watchlist)
+    return [make_watch_item(url, "PRODUCT_URLS") for url in PRODUCT_URLS]
+
+def shard_key(url):
+    """シャードの割り当てに使うキー（商品ページは商品ID、それ以外はURL）"""
+    match = PRODUCT_LINK_PATTERN.search(url)
+    return match.group(1) if match else url
+
+def shard_index(url, count):
+    """URLが属するシャード（1〜count）を返す
+
+    実行環境によって値が変わる hash() ではなく、商品IDのSHA-1で決めるため、
+    どのランナーでも同じ商品は同じシャードに割り当てられる。
+    """
+    digest = hashlib.sha1(shard_key(url).encode("utf-8")).hexdigest()
+    return int(digest, 16) % count + 1
+
+def select_shard(watch_items, shard):
+    """監視リストから指定したシャード（(番号, シャード数)）に属する項目だけを返す"""
+    if shard is None:
+        return watch_items
+    index, count = shard
+    return [item for item in watch_items if shard_index(item.url, count) == index]
+
+def parse_shard(value):
+    """--shard の値（"i/N"）を (i, N) に変換する"""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("シャードは i/N の形式で指定してください（例: 1/4）")
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("シャード番号は 1〜N で指定してください")
+    return index, count
@@ -0,0 +1,390 @@
+"""CI Medicalのログインページと商品ページを模したローカルスタブサーバー
+
+実際のログイン情報やChromeなしで、HTTP取得方式の動作を確認するために使う。
+LINE Messaging APIのスタブ（/v2/bot/message/push, /v2/bot/message/broadcast）と、
+受信したメールを表示するだけのSMTPサーバーも起動できる。
+
+使い方:
+    python stub_server.py --port 8000 --smtp-port 8025
+
+    LOGIN_URL=http://127.0.0.1:8000/accounts/sign_in \\
+    CI_MEDICAL_USERNAME=stub CI_MEDICAL_PASSWORD=stub \\
+    python stock_monitor.py --backend http \\
+        --url http://127.0.0.1:8000/dental/catalog_item/801Y880
+
+    カテゴリー/検索結果ページの展開は --url http://127.0.0.1:8000/dental/catalog_items で確認できる。
+
+    通知の確認には、さらに以下を指定する:
+    LINE_API_BASE=http://127.0.0.1:8000 LINE_CHANNEL_ACCESS_TOKEN=stub \
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=8025 SMTP_STARTTLS=false \
+    SENDER_EMAIL=from@example.com SENDER_PASSWORD=stub RECEIVER_EMAIL=to@example.com
+"""
+import argparse
+import hashlib
+import json
+import secrets
+import socketserver
+import threading
+import time
+from email.header import decode_header, make_header
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs, urlparse
+
+STUB_USERNAME = "stub"
+STUB_PASSWORD = "stub"
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><title>ログイン | CI Medical</title>
+<meta name="csrf-param" content="authenticity_token">
+<meta name="csrf-token" content="{token}">
+</head><body>
+<form action="/accounts/sign_in" method="post">
+<input type="hidden" name="utf8" value="&#x2713;">
+<input type="hidden" name="authenticity_token" value="{token}">
+<input type="text" id="account_login" name="account[login]">
+<input type="password" id="account_password" name="account[password]">
+<input type="submit" name="commit" value="ログイン">
+</form>
+</body></html>
+"""
+
+PRODUCT_PAGE = """<!DOCTYPE html>
+<html><head><title>{name}の通販 | CI Medical</title></head><body>
+<h1 class="product-title">{name}</h1>
+{body}
+</body></html>
+"""
+
+# 商品ID -> (商品名, 在庫表示部分のHTML)
+PRODUCT_PAGES = {
+    "801Y880": (
+        "スタブ商品A（在庫あり）",
+        '<p class="product-price__txt">1,200円</p>'
+        '<span class="product-stock__status">在庫あり</span>'
+        '<a class="button-cart" href="#">買い物カゴに入れる</a>',
+    ),
+    "801Y697": (
+        "スタブ商品B（在庫なし）",
+        '<p class="product-price__txt">3,400円</p>'
+        '<span class="product-stock__status is-soldout">在庫なし</span>'
+        '<a class="button-cart button-cart--disabled" href="#">在庫なし</a>',
+    ),
+    # JavaScriptで描画される想定のページ（HTTP取得では在庫表示要素がない）
+    "801Y168": (
+        "スタブ商品C（JS描画）",
+        '<div id="app"></div>',
+    ),
+}
+
+LISTING_PAGE = """<!DOCTYPE html>
+<html><head><title>商品一覧 | CI Medical</title></head><body>
+<h1>商品一覧</h1>
+<ul class="product-list">
+{items}
+</ul>
+{pager}
+</body></html>
+"""
+
+LISTING_ITEM = """<li class="product-list__item">
+<a href="/dental/catalog_item/{product_id}"><img src="/images/{product_id}.jpg" alt=""></a>
+<a class="product-list__name" href="/dental/catalog_item/{product_id}">{name}</a>
+{stock}
+</li>"""
+
+# 一覧ページでの在庫表示（商品C は一覧に在庫表示がなく、商品ページを開かないと判定できない想定）
+LISTING_STOCK = {
+    "801Y880": '<span class="product-stock__status">在庫あり</span>',
+    "801Y697": '<span class="product-stock__status is-soldout">在庫なし</span>',
+    "801Y168": '<p class="product-price__txt">5,600円</p>',
+}
+LISTING_PAGE_SIZE = 2
+
+def render_listing_page(path, page):
+    """PRODUCT_PAGES の商品を LISTING_PAGE_SIZE 件ずつ並べた一覧ページを作る"""
+    product_ids = list(PRODUCT_PAGES)
+    start = (page - 1) * LISTING_PAGE_SIZE
+    items = "\n".join(
+        LISTING_ITEM.format(product_id=product_id, name=PRODUCT_PAGES[product_id][0], stock=LISTING_STOCK[product_id])
+        for product_id in product_ids[start:start + LISTING_PAGE_SIZE]
+    )
+    pager = ""
+    if start + LISTING_PAGE_SIZE < len(product_ids):
+        pager = f'<a rel="next" href="{path}?page={page + 1}">次へ</a>'
+    return LISTING_PAGE.format(items=items, pager=pager)
+
+def render_product_pages():
+    """PRODUCT_PAGES から 商品ID -> 商品ページのHTML の辞書を作る"""
+    return {
+        product_id: PRODUCT_PAGE.format(name=name, body=body)
+        for product_id, (name, body) in PRODUCT_PAGES.items()
+    }
+
+class StubState:
+    """発行したCSRFトークンとログイン済みセッションを保持する
+
+    pages を指定した場合は PRODUCT_PAGES の代わりに、商品ID -> HTML の辞書のページを返す。
+    delay を指定した場合は、商品ページを返す前にその秒数だけ待つ（サイトの応答時間の再現用）。
+    """
+
+    def __init__(self, pages=None, delay=0.0):
+        self.pages = pages if pages is not None else render_product_pages()
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.csrf_tokens = set()
+        self.sessions = set()
+        self.login_count = 0
+        # LINEのスタブで受け取ったリクエストと、先頭から429を返すリクエスト数
+        self.line_requests = []
+        self.line_rate_limited = 0
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def session_id(self):
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        morsel = cookie.get("_stub_session")
+        return morsel.value if morsel else None
+
+    def send_html(self, html, status=200, cookie=None, etag=None):
+        body = html.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        if cookie:
+            self.send_header("Set-Cookie", cookie)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location, cookie=None):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        if cookie:
+            self.send_header("Set-Cookie", cookie)
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.startswith("/accounts/sign_in"):
+            # Deviseと同じく、ログイン済みの場合はトップページへリダイレクトする
+            with self.state.lock:
+                logged_in = self.session_id() in self.state.sessions
+            if logged_in:
+                self.redirect("/")
+                return
+            token = secrets.token_urlsafe(16)
+            with self.state.lock:
+                self.state.csrf_tokens.add(token)
+            self.send_html(LOGIN_PAGE.format(token=token))
+            return
+
+        if self.path.startswith("/dental/catalog_item/"):
+            with self.state.lock:
+                logged_in = self.session_id() in self.state.sessions
+            if not logged_in:
+                self.redirect("/accounts/sign_in")
+                return
+
+            product_id = self.path.rstrip("/").split("/")[-1]
+            html = self.state.pages.get(product_id)
+            if html is None:
+                self.send_html("<html><body>Not Found</body></html>", status=404)
+                return
+            if self.state.delay:
+                time.sleep(self.state.delay)
+
+            # 条件付きリクエストに対応する（内容が同じなら304を返す）
+            etag = '"' + hashlib.md5(html.encode("utf-8")).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_html(html, etag=etag)
+            return
+
+        if self.path.startswith(("/dental/catalog_items", "/dental/search")):
+            with self.state.lock:
+                logged_in = self.session_id() in self.state.sessions
+            if not logged_in:
+                self.redirect("/accounts/sign_in")
+                return
+            url = urlparse(self.path)
+            page = int(parse_qs(url.query).get("page", ["1"])[0])
+            self.send_html(render_listing_page(url.path, page))
+            return
+
+        if self.path == "/":
+            self.send_html("<html><body>トップページ</body></html>")
+            return
+
+        self.send_html("<html><body>Not Found</body></html>", status=404)
+
+    def do_POST(self):
+        if self.path in ("/v2/bot/message/push", "/v2/bot/message/broadcast"):
+            self.handle_line()
+            return
+
+        if not self.path.startswith("/accounts/sign_in"):
+            self.send_html("<html><body>Not Found</body></html>", status=404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        token = form.get("authenticity_token", [""])[0]
+        username = form.get("account[login]", [""])[0]
+        password = form.get("account[password]", [""])[0]
+
+        with self.state.lock:
+            valid_token = token in self.state.csrf_tokens
+            self.state.csrf_tokens.discard(token)
+
+        if not valid_token:
+            self.send_html("<html><body>InvalidAuthenticityToken</body></html>", status=422)
+            return
+        if username != STUB_USERNAME or password != STUB_PASSWORD:
+            self.redirect("/accounts/sign_in")
+            return
+
+        session_id = secrets.token_urlsafe(16)
+        with self.state.lock:
+            self.state.sessions.add(session_id)
+            self.state.login_count += 1
+        self.redirect("/", cookie=f"_stub_session={session_id}; Path=/; HttpOnly")
+
+    def handle_line(self):
+        """LINE Messaging APIを模して、受け取ったメッセージを記録する"""
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length).decode("utf-8"))
+
+        with self.state.lock:
+            rate_limited = self.state.line_rate_limited > 0
+            if rate_limited:
+                self.state.line_rate_limited -= 1
+            else:
+                self.state.line_requests.append(payload)
+
+        if rate_limited:
+            body = b'{"message":"The API rate limit has been exceeded. Try again later."}'
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+        elif not self.headers.get("Authorization", "").startswith("Bearer ") or len(payload.get("messages", [])) > 5:
+            body = b'{"message":"The request body has 1 error(s)"}'
+            self.send_response(400)
+        else:
+            body = b"{}"
+            self.send_response(200)
+            for message in payload["messages"]:
+                print(f"[LINE] {message['text'].splitlines()[0]}")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """受け取ったメールを記録するだけの最小限のSMTPサーバー（STARTTLSには対応しない）"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        self.reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb == "EHLO":
+                self.reply("250-stub")
+                self.reply("250 AUTH PLAIN")
+            elif verb == "HELO":
+                self.reply("250 stub")
+            elif verb == "AUTH":
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data_line)
+                message = b"".join(lines).decode("utf-8", "replace")
+                with self.server.lock:
+                    self.server.messages.append(message)
+                subject = next((l[len("Subject:"):].strip() for l in message.splitlines() if l.startswith("Subject:")), "")
+                print(f"[SMTP] {str(make_header(decode_header(subject)))}")
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+class SmtpSinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+def start_smtp_sink(host="127.0.0.1", port=0):
+    """SMTPサーバーを別スレッドで起動する（受け取ったメールは server.messages に記録される）
+
+    Returns:
+        SmtpSinkServer: 起動したサーバー
+    """
+    server = SmtpSinkServer((host, port), SmtpSinkHandler)
+    server.lock = threading.Lock()
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def start_stub_server(host="127.0.0.1", port=0, pages=None, delay=0.0):
+    """スタブサーバーを別スレッドで起動する（pages と delay は StubState を参照）
+
+    Returns:
+        tuple: (サーバー, ベースURL) のタプル
+    """
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(pages, delay)})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="CI Medical スタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--smtp-port", type=int, default=0, help="SMTPサーバーのポート（0の場合は起動しない）")
+    parser.add_argument("--line-rate-limited", type=int, default=0, help="LINEのスタブが最初に429を返すリクエスト数")
+    parser.add_argument("--delay", type=float, default=0.0, help="商品ページを返すまでの待ち時間（秒）")
+    args = parser.parse_args()
+
+    if args.smtp_port:
+        start_smtp_sink(args.host, args.smtp_port)
+        print(f"SMTPサーバーを起動しました: {args.host}:{args.smtp_port}")
+
+    state = StubState(delay=args.delay)
+    state.line_rate_limited = args.line_rate_limited
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"スタブサーバーを起動しました: http://{args.host}:{args.port}")
+    print(f"ログイン情報: {STUB_USERNAME} / {STUB_PASSWORD}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()